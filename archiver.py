@@ -0,0 +1,171 @@
+"""
+Compressed archives of raw mnp and full hlr files.
+A file is read in blocks and every block is compressed on its own on a thread pool (zlib, bz2, lzma and zstandard
+release the GIL while compressing), compressed blocks are written in order as members of one gzip, bzip2, xz or
+zstd file. The gzip, bzip2, xz and zstd tools and the gzip, bz2 and lzma modules decompress such multi member files
+as a whole, zstandard only with ZstdDecompressor().stream_reader(f, read_across_frames=True):
+its decompress and decompressobj stop after the first frame.
+zstandard is an optional dependency, without it zstd falls back to deflate.
+ArchiveStore keeps archives content addressed, a file that did not change is only hashed
+"""
+import bz2
+import gzip
+import hashlib
+import importlib.util
+import json
+import lzma
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Deque, NamedTuple, Optional
+
+from logger_config import configure_logger
+
+logger = configure_logger(__name__)
+
+
+class Codec(NamedTuple):
+    extension: str
+    compress: Callable[[bytes, int], bytes]
+    default_level: int
+
+
+def _deflate(data: bytes, level: int) -> bytes:
+    # mtime=0 makes gzip.compress a single zlib call, the archive name has the date anyway
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def _bz2(data: bytes, level: int) -> bytes:
+    return bz2.compress(data, compresslevel=level)
+
+
+def _lzma(data: bytes, level: int) -> bytes:
+    return lzma.compress(data, preset=level)
+
+
+def _zstd(data: bytes, level: int) -> bytes:
+    import zstandard
+
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+CODECS = {
+    'deflate': Codec('.gz', _deflate, 6),
+    'bz2': Codec('.bz2', _bz2, 9),
+    'lzma': Codec('.xz', _lzma, 6),
+    'zstd': Codec('.zst', _zstd, 3),
+}
+
+
+def get_codec(name: str) -> Codec:
+    if name == 'zstd' and importlib.util.find_spec('zstandard') is None:
+        logger.warning('zstandard is not installed, archive with deflate instead of zstd')
+        name = 'deflate'
+
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise ValueError(f'unknown archive codec {name}, expected one of: {", ".join(CODECS)}') from None
+
+
+def compress_file(
+        source_file: str,
+        destination: str,
+        codec: Codec,
+        level: Optional[int] = None,
+        block_size: int = 16 * 1024 * 1024,
+        threads: int = 1,
+) -> int:
+    """
+    Compress source_file into destination in blocks of block_size bytes on threads threads.
+    At most two blocks per thread are held in memory, destination is replaced atomically
+    :return: size of the compressed file
+    """
+    level = codec.default_level if level is None else level
+    tmp_destination = f'{destination}.tmp'
+    compressed_bytes = 0
+    try:
+        with open(source_file, 'rb') as in_f, open(tmp_destination, 'wb') as out_f, \
+                ThreadPoolExecutor(max_workers=threads) as executor:
+            pending: Deque[Future] = deque()
+            # an empty file still gets one (empty) member, an empty gzip/xz/... file is not valid
+            block = in_f.read(block_size)
+            while True:
+                pending.append(executor.submit(codec.compress, block, level))
+                if len(pending) >= 2 * threads:
+                    compressed_bytes += out_f.write(pending.popleft().result())
+
+                block = in_f.read(block_size)
+                if not block:
+                    break
+
+            while pending:
+                compressed_bytes += out_f.write(pending.popleft().result())
+    except BaseException:
+        try:
+            os.remove(tmp_destination)
+        except FileNotFoundError:
+            pass
+
+        raise
+
+    os.replace(tmp_destination, destination)
+    return compressed_bytes
+
+
+class ArchiveStore:
+    """
+    Content addressed archive directory:
+    blobs/<sha256[:2]>/<sha256><extension> is the archive of a file content, written once,
+    manifest/<YYYYMMDD>.jsonl gets a line per archived file: time, prefix, file name, size, sha256 and blob
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(self, archive_dir: str):
+        self.archive_dir = archive_dir
+
+    def add(
+            self,
+            source_file: str,
+            file_prefix: str,
+            extension: str,
+            write_archive: Callable[[str, str], None],
+    ) -> str:
+        """
+        Archive source_file with write_archive(source_file, archive_file) unless a blob of the same content exists
+        :return: path of the blob
+        """
+        with open(source_file, 'rb') as f:
+            digest = hashlib.file_digest(f, 'sha256').hexdigest()
+
+        blob = os.path.join('blobs', digest[:2], f'{digest}{extension}')
+        blob_file = os.path.join(self.archive_dir, blob)
+
+        stored = not os.path.exists(blob_file)
+        if stored:
+            os.makedirs(os.path.dirname(blob_file), exist_ok=True)
+            write_archive(source_file, blob_file)
+        else:
+            logger.info(f'{source_file} did not change since it was archived to {blob_file}')
+
+        now = datetime.now()
+        self._append_manifest(now, {
+            'time': now.isoformat(timespec='seconds'),
+            'prefix': file_prefix,
+            'file': os.path.basename(source_file),
+            'size': os.path.getsize(source_file),
+            'sha256': digest,
+            'blob': blob,
+            'stored': stored,
+        })
+        return blob_file
+
+    def _append_manifest(self, day: datetime, entry: dict) -> None:
+        manifest_directory = os.path.join(self.archive_dir, 'manifest')
+        os.makedirs(manifest_directory, exist_ok=True)
+        manifest_file = os.path.join(manifest_directory, f'{day.strftime("%Y%m%d")}.jsonl')
+        with self._lock, open(manifest_file, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
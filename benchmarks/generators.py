@@ -0,0 +1,93 @@
+"""
+Synthetic mnp feeds in the formats of every supported country
+"""
+import datetime
+import random
+from typing import Callable, Dict
+
+# openpyxl/Excel limit, Belarus feeds are capped to it
+XLSX_MAX_ROWS = 1_048_576
+
+_PORT_DATE_START = datetime.datetime(2015, 1, 1)
+_PORT_DATE_RANGE = 9 * 365 * 86400
+
+
+def _port_date(rnd: random.Random) -> datetime.datetime:
+    # ports cluster on business days and hours, so dates repeat heavily like in real feeds
+    day = rnd.randint(0, _PORT_DATE_RANGE // 86400)
+    return _PORT_DATE_START + datetime.timedelta(days=day, hours=rnd.randint(9, 18), seconds=rnd.randint(0, 3599))
+
+
+def generate_kazakhstan(path: str, rows: int, seed: int = 0) -> None:
+    # Number,OwnerId,MNC,Route,PortDate,RowCount with a header line
+    rnd = random.Random(seed)
+    with open(path, 'w') as f:
+        f.write('Number,OwnerId,MNC,Route,PortDate,RowCount\n')
+        for _ in range(rows):
+            mnc = rnd.choice((1, 2, 7, 8))
+            f.write(
+                f'77{rnd.randint(0, 99_999_999):08d}0,{rnd.randint(1, 5)},{mnc},D{mnc:02d}{rnd.randint(1, 9):02d},'
+                f'{_port_date(rnd):%Y-%m-%d %H:%M:%S},{rows}\n',
+            )
+
+
+def generate_latvia(path: str, rows: int, seed: int = 0) -> None:
+    # "<number> <RN>", about 2% of the RNs are not mapped
+    rnd = random.Random(seed)
+    routes = ('BC20', 'BC21', 'BC40', 'BC10', 'BC30')
+    with open(path, 'w') as f:
+        for _ in range(rows):
+            route = 'BC99' if rnd.random() < 0.02 else rnd.choice(routes)
+            f.write(f'2{rnd.randint(0, 9_999_999):07d} {route}\n')
+
+
+def generate_belarus(path: str, rows: int, seed: int = 0) -> None:
+    # Sheet1: mnc, msisdn, "dd.mm.yyyy HH:MM:SS", a .csv path gets the semicolon separated export instead
+    import openpyxl
+
+    rnd = random.Random(seed)
+    if path.endswith('.csv'):
+        with open(path, 'w') as f:
+            for _ in range(rows):
+                f.write(f'{rnd.choice((1, 2, 4))};37529{rnd.randint(0, 9_999_999):07d};'
+                        f'{_port_date(rnd):%d.%m.%Y %H:%M:%S}\n')
+
+        return
+
+    work_book = openpyxl.Workbook(write_only=True)
+    sheet = work_book.create_sheet('Sheet1')
+    for _ in range(min(rows, XLSX_MAX_ROWS)):
+        sheet.append([rnd.choice((1, 2, 4)), 375290000000 + rnd.randint(0, 9_999_999),
+                      f'{_port_date(rnd):%d.%m.%Y %H:%M:%S}'])
+
+    work_book.save(path)
+
+
+def generate_georgia(path: str, rows: int, seed: int = 0) -> None:
+    # semicolon csv with a header: record type;...;number type;number;...;operator;...;port date (10th field)
+    rnd = random.Random(seed)
+    operators = (10, 11, 12, 41, 49)
+    with open(path, 'w') as f:
+        f.write('RecordType;Id;NumberType;Number;Donor;Recipient;Status;Created;Modified;PortDate\n')
+        for index in range(rows):
+            record_type = '10' if rnd.random() < 0.95 else '20'
+            number_type = '2' if rnd.random() < 0.9 else '1'
+            f.write(
+                f'{record_type};{index};{number_type};9955{rnd.randint(0, 99_999_999):08d};'
+                f'{rnd.choice(operators)};{rnd.choice(operators)};1;;;{_port_date(rnd):%Y-%m-%d %H:%M:%S}\n',
+            )
+
+
+GENERATORS: Dict[str, Callable[[str, int, int], None]] = {
+    'Kazakhstan': generate_kazakhstan,
+    'Latvia': generate_latvia,
+    'Belarus': generate_belarus,
+    'Georgia': generate_georgia,
+}
+
+FILE_NAMES = {
+    'Kazakhstan': 'kazakhstan.csv',
+    'Latvia': 'latvia.txt',
+    'Belarus': 'belarus.xlsx',
+    'Georgia': 'georgia.csv',
+}
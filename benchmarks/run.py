@@ -0,0 +1,213 @@
+"""
+Benchmark of the parse, save, join and archive stages on synthetic feeds.
+
+    python -m benchmarks.run --rows 100000 1000000 --output results.json
+    python -m benchmarks.run --rows --startup-budget 0.8
+
+Every stage runs in a fresh process, its wall time and peak RSS are recorded.
+Timings depend on the machine and its load, compare --output results of runs on the same one.
+Startup is the import of the entry point modules in a new interpreter, best of STARTUP_REPEAT runs,
+with --startup-budget the run fails when an entry point takes longer to start.
+Parser settings from the environment (COLUMNAR_COUNTRIES, ...) apply as in a normal run
+"""
+import argparse
+import collections
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List
+
+from benchmarks.generators import FILE_NAMES, GENERATORS
+
+# progress goes to stderr, repository modules log into LOG_FILE of the work directory
+logger = logging.getLogger('benchmarks')
+
+# modules run as entry points: the full run and the lookup CLIs
+STARTUP_MODULES = ('main', 'mnp_index', 'routing')
+STARTUP_REPEAT = 5
+REPOSITORY_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def configure_environment(work_directory: str) -> None:
+    # settings are read from the environment on first use, point every directory into the work directory
+    directories = {
+        'TMP_DIRECTORY': 'tmp',
+        'FTP_DIRECTORY': 'ftp',
+        'HLR_DIRECTORY': 'hlr',
+        'ARCHIVE_DIRECTORY': 'archive',
+    }
+    for variable, directory in directories.items():
+        os.environ[variable] = os.path.join(work_directory, directory)
+        os.makedirs(os.environ[variable], exist_ok=True)
+
+    for prefix in ('georgia', 'kazakhstan', 'belarus', 'latvia'):
+        for variable in ('FTP_DIRECTORY', 'HLR_DIRECTORY'):
+            os.makedirs(os.path.join(os.environ[variable], prefix), exist_ok=True)
+
+    os.environ['FULL_HLR_FILE'] = os.path.join(work_directory, 'full_hlr.csv')
+    os.environ['LOG_FILE'] = os.path.join(work_directory, 'benchmark.log')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    # an empty value wins over .env, the save stage must not write synthetic numbers into the real index
+    os.environ['MNP_INDEX_FILE'] = ''
+    for variable in (
+            'SMSSW_SERVER', 'SMSSW_SERVER_USER', 'SMSSW_FULL_HLR_FILE_PATH',
+            'GEORGIA_FTP_SERVER', 'GEORGIA_FTP_USER', 'GEORGIA_FTP_PASSWORD',
+            'KAZAKHSTAN_FTP_SERVER', 'KAZAKHSTAN_FTP_USER', 'KAZAKHSTAN_FTP_PASSWORD',
+            'BELARUS_SOURCE_DIRECTORY', 'LATVIA_SOURCE_DIRECTORY',
+    ):
+        os.environ.setdefault(variable, 'benchmark')
+
+    os.environ.setdefault('GEORGIA_FTP_PORT', '21')
+    os.environ.setdefault('KAZAKHSTAN_FTP_PORT', '21')
+
+
+def _run_measured(function: Callable, *args) -> Dict[str, float]:
+    # runs in a fresh process
+    started = time.perf_counter()
+    function(*args)
+    return {
+        'seconds': round(time.perf_counter() - started, 4),
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def measure(function: Callable, *args) -> Dict[str, float]:
+    # a fork of this process would start with its peak RSS (generated feeds, ...), the fork server only imported
+    # the stage modules (see run), so the peak RSS of a stage is its own plus the imports
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('forkserver')) as executor:
+        return executor.submit(_run_measured, function, *args).result()
+
+
+def measure_startup(module: str) -> Dict[str, float]:
+    code = f'import resource, {module}; print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)'
+    runs = []
+    for _ in range(STARTUP_REPEAT):
+        started = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, '-c', code],
+            cwd=REPOSITORY_DIRECTORY,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        runs.append({'seconds': round(time.perf_counter() - started, 4), 'peak_rss_kb': int(output.split()[-1])})
+
+    return min(runs, key=lambda result: result['seconds'])
+
+
+def stage_parse(country_name: str, raw_file: str) -> None:
+    from parsers.parser import GeorgiaMnpParser, AvailableCountry, get_parser
+
+    parser = GeorgiaMnpParser() if country_name == 'Georgia' else get_parser(AvailableCountry[country_name])
+    collections.deque(parser.parse(raw_file), maxlen=0)
+
+
+def stage_save(country_name: str, raw_file: str) -> None:
+    from parsers.parser import AvailableCountry
+    from pipeline import parse_country
+
+    parse_country(AvailableCountry[country_name], raw_file, int(time.time()))
+
+
+def stage_join() -> None:
+    from file_handlers.file_handler import join_all_files
+
+    join_all_files()
+
+
+def stage_archive(country_name: str, raw_file: str) -> None:
+    from utils import archive_file
+
+    archive_file(raw_file, country_name)
+
+
+def run(rows_list: List[int], countries: List[str], work_directory: str) -> Dict[str, Dict[str, float]]:
+    # imported by the fork server before the stage processes are forked, so stages do not time imports
+    multiprocessing.get_context('forkserver').set_forkserver_preload(['file_handlers.file_handler', 'pipeline'])
+    from parsers.parser import AvailableCountry
+
+    results = {}
+    for module in STARTUP_MODULES:
+        results[f'startup/{module}'] = measure_startup(module)
+        logger.info(f'startup/{module}: {results[f"startup/{module}"]}')
+
+    for rows in rows_list:
+        for country_name in countries:
+            raw_file = os.path.join(work_directory, f'{rows}-{FILE_NAMES[country_name]}')
+            if not os.path.exists(raw_file):
+                logger.info(f'generating {raw_file}')
+                GENERATORS[country_name](raw_file, rows, 0)
+
+            results[f'{country_name}/{rows}/parse'] = measure(stage_parse, country_name, raw_file)
+            # Georgia is not an AvailableCountry yet: no output files to save
+            if country_name in AvailableCountry.__members__:
+                results[f'{country_name}/{rows}/save'] = measure(stage_save, country_name, raw_file)
+
+            results[f'{country_name}/{rows}/archive'] = measure(stage_archive, country_name, raw_file)
+            for stage in ('parse', 'save', 'archive'):
+                name = f'{country_name}/{rows}/{stage}'
+                if name in results:
+                    logger.info(f'{name}: {results[name]}')
+
+        results[f'join/{rows}'] = measure(stage_join)
+        logger.info(f'join/{rows}: {results[f"join/{rows}"]}')
+
+    return results
+
+
+def over_budget(results: Dict[str, Dict[str, float]], budget: float) -> List[str]:
+    """
+    :return: descriptions of the entry points that take longer than budget seconds to start
+    """
+    return [
+        f'{name}: {result["seconds"]}s, budget {budget}s'
+        for name, result in results.items()
+        if name.startswith('startup/') and result['seconds'] > budget
+    ]
+
+
+def main() -> int:
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument(
+        '--rows',
+        type=int,
+        nargs='*',
+        default=[100_000, 1_000_000, 10_000_000],
+        help='feed sizes, none measures startup only',
+    )
+    arg_parser.add_argument('--countries', nargs='+', default=list(GENERATORS), choices=list(GENERATORS))
+    arg_parser.add_argument('--work-directory', help='keeps generated feeds between runs, a temporary one by default')
+    arg_parser.add_argument('--output', help='write results as json')
+    arg_parser.add_argument('--startup-budget', type=float, help='allowed startup of an entry point in seconds')
+    args = arg_parser.parse_args()
+    logger.addHandler(logging.StreamHandler())
+    logger.setLevel(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as tmp_directory:
+        work_directory = args.work_directory or tmp_directory
+        configure_environment(work_directory)
+        results = run(args.rows, args.countries, work_directory)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    failures = []
+    if args.startup_budget is not None:
+        failures.extend(f'OVER BUDGET {startup}' for startup in over_budget(results, args.startup_budget))
+
+    for failure in failures:
+        logger.error(failure)
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
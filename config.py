@@ -1,4 +1,5 @@
-from typing import ClassVar
+from functools import cached_property
+from typing import ClassVar, Optional, cast
 
 from pydantic import Field
 from pydantic_settings import BaseSettings
@@ -19,7 +20,7 @@ class GeorgiaMnpSettings(BaseSettings):
     ftp_port: int = Field(validation_alias='GEORGIA_FTP_PORT')
     ftp_user: str = Field(validation_alias='GEORGIA_FTP_USER')
     ftp_password: str = Field(validation_alias='GEORGIA_FTP_PASSWORD')
-    file_prefix: str = 'georgia'
+    file_prefix: ClassVar[str] = 'georgia'
 
 
 class KazakhstanMnpSettings(BaseSettings):
@@ -27,17 +28,17 @@ class KazakhstanMnpSettings(BaseSettings):
     ftp_port: int = Field(validation_alias='KAZAKHSTAN_FTP_PORT')
     ftp_user: str = Field(validation_alias='KAZAKHSTAN_FTP_USER')
     ftp_password: str = Field(validation_alias='KAZAKHSTAN_FTP_PASSWORD')
-    file_prefix: str = 'kazakhstan'
+    file_prefix: ClassVar[str] = 'kazakhstan'
 
 
 class BelarusMnpSettings(BaseSettings):
     source_directory: str = Field(validation_alias='BELARUS_SOURCE_DIRECTORY')
-    file_prefix: str = 'belarus'
+    file_prefix: ClassVar[str] = 'belarus'
 
 
 class LatviaMnpSettings(BaseSettings):
     source_directory: str = Field(validation_alias='LATVIA_SOURCE_DIRECTORY')
-    file_prefix: str = 'latvia'
+    file_prefix: ClassVar[str] = 'latvia'
 
 
 class Settings(BaseSettings):
@@ -49,11 +50,99 @@ class Settings(BaseSettings):
     smssw_server: str = Field(validation_alias='SMSSW_SERVER')
     smssw_user: str = Field(validation_alias='SMSSW_SERVER_USER')
     smssw_full_hlr_file_path: str = Field(validation_alias='SMSSW_FULL_HLR_FILE_PATH')
-    georgia_settings: ClassVar = GeorgiaMnpSettings()
-    kazakhstan_settings: ClassVar = KazakhstanMnpSettings()
-    belarus_settings: ClassVar = BelarusMnpSettings()
-    latvia_settings: ClassVar = LatviaMnpSettings()
-
-
-settings = Settings()
+    # last fetched file per FTP source, used to skip sources without a new file
+    ftp_cache_file: str = Field(validation_alias='FTP_CACHE_FILE', default='ftp_cache.json')
+    # FTP downloads: reconnect and resume attempts, parallel ranged sessions for files of at least min size (bytes)
+    ftp_retries: int = Field(validation_alias='FTP_RETRIES', default=3)
+    ftp_segments: int = Field(validation_alias='FTP_SEGMENTS', default=1)
+    ftp_segment_min_size: int = Field(validation_alias='FTP_SEGMENT_MIN_SIZE', default=64 * 1024 * 1024)
+    # parse FTP downloads straight from the zip file instead of extracting them first
+    stream_zip: bool = Field(validation_alias='STREAM_ZIP', default=False)
+    # keep the previous hlr3 files and produce delta files for incremental HLR3 loads
+    hlr_delta: bool = Field(validation_alias='HLR_DELTA', default=False)
+    # sort the full hlr file by dnis and keep the latest record of every number
+    sort_full_hlr: bool = Field(validation_alias='SORT_FULL_HLR', default=False)
+    sort_buffer_lines: int = Field(validation_alias='SORT_BUFFER_LINES', default=1_000_000)
+    # countries parsed with the numpy backend (comma separated names, e.g. Kazakhstan,Latvia)
+    columnar_countries: str = Field(validation_alias='COLUMNAR_COUNTRIES', default='')
+    columnar_block_rows: int = Field(validation_alias='COLUMNAR_BLOCK_ROWS', default=100_000)
+    max_workers: int = Field(validation_alias='MAX_WORKERS', default=4)
+    # downloaded files allowed to wait in TMP_DIRECTORY for parsing and archiving
+    max_pending_files: int = Field(validation_alias='MAX_PENDING_FILES', default=2)
+    # files bigger than this (bytes) are parsed in parallel chunks when the parser supports it, 0 disables
+    parse_chunk_size: int = Field(validation_alias='PARSE_CHUNK_SIZE', default=0)
+    # archives of raw mnp and full hlr files: stored (zip without compression), deflate, bz2, lzma or zstd,
+    # the level defaults to the codec default, blocks of block size (bytes) are compressed on archive threads
+    archive_codec: str = Field(validation_alias='ARCHIVE_CODEC', default='deflate')
+    archive_level: Optional[int] = Field(validation_alias='ARCHIVE_LEVEL', default=None)
+    archive_block_size: int = Field(validation_alias='ARCHIVE_BLOCK_SIZE', default=16 * 1024 * 1024)
+    archive_threads: int = Field(validation_alias='ARCHIVE_THREADS', default=4)
+    # content addressed archives: a blob per distinct file content and a manifest per day (see archiver.ArchiveStore)
+    archive_dedup: bool = Field(validation_alias='ARCHIVE_DEDUP', default=False)
+    # push to the SMSSW server: scp or sftp (one session, temporary name and rename, skipped when checksums match),
+    # sftp option: compression on the wire
+    push_mode: str = Field(validation_alias='PUSH_MODE', default='scp')
+    push_compress: bool = Field(validation_alias='PUSH_COMPRESS', default=True)
+    # load the full hlr file (or its delta) into HLR3 after the push, batch files have to be readable by HLR3
+    hlr3_load: bool = Field(validation_alias='HLR3_LOAD', default=False)
+    hlr3_load_url: str = Field(
+        validation_alias='HLR3_LOAD_URL',
+        default='http://127.0.0.1:42082/http/api/?login=hlr_configurator&password=hlr_configurator',
+    )
+    hlr3_load_concurrency: int = Field(validation_alias='HLR3_LOAD_CONCURRENCY', default=2)
+    hlr3_batch_lines: int = Field(validation_alias='HLR3_BATCH_LINES', default=1_000_000)
+    hlr3_batch_directory: str = Field(validation_alias='HLR3_BATCH_DIRECTORY', default='/tmp')
+    # HLR2 refbook (DIAL_CODE;MCC_MNC) loaded along with the full hlr file
+    hlr3_refbook_file: str = Field(validation_alias='HLR3_REFBOOK_FILE', default='')
+    # SQLite index of the current record and history of every number, updated on every save, empty disables it
+    mnp_index_file: str = Field(validation_alias='MNP_INDEX_FILE', default='')
+    # routing snapshot (see routing) built from the full hlr file and HLR3_REFBOOK_FILE after the join, empty disables
+    routing_snapshot_file: str = Field(validation_alias='ROUTING_SNAPSHOT_FILE', default='')
+    # JSON run reports and the Prometheus textfile collector file are written here, empty disables them
+    metrics_directory: str = Field(validation_alias='METRICS_DIRECTORY', default='')
+
+    # country settings are read on first use, a run without a country does not need its variables
+    @cached_property
+    def georgia_settings(self) -> GeorgiaMnpSettings:
+        return GeorgiaMnpSettings()
+
+    @cached_property
+    def kazakhstan_settings(self) -> KazakhstanMnpSettings:
+        return KazakhstanMnpSettings()
+
+    @cached_property
+    def belarus_settings(self) -> BelarusMnpSettings:
+        return BelarusMnpSettings()
+
+    @cached_property
+    def latvia_settings(self) -> LatviaMnpSettings:
+        return LatviaMnpSettings()
+
+
+class _SettingsOnFirstUse:
+    """
+    Settings read from the environment on first use, so tools that need a few variables
+    (python -m mnp_index, python -m routing) start without the ones of a full run
+    """
+
+    def __init__(self):
+        object.__setattr__(self, '_settings', None)
+
+    def __getattr__(self, name: str):
+        return getattr(self._read(), name)
+
+    def __setattr__(self, name: str, value) -> None:
+        setattr(self._read(), name, value)
+
+    def __delattr__(self, name: str) -> None:
+        delattr(self._read(), name)
+
+    def _read(self) -> Settings:
+        if self._settings is None:
+            object.__setattr__(self, '_settings', Settings())
+
+        return self._settings
+
+
+settings = cast(Settings, _SettingsOnFirstUse())
 log_settings = LoggerSettings()
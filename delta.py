@@ -0,0 +1,94 @@
+import os
+import sys
+from dataclasses import dataclass
+from typing import Tuple
+
+from logger_config import configure_logger
+
+logger = configure_logger(__name__)
+
+
+@dataclass
+class DeltaResult:
+    added: int = 0
+    changed: int = 0
+    removed: int = 0
+
+
+def snapshot_file(hlr3_file: str) -> str:
+    # version of a hlr3 file that was last pushed to HLR3, deltas are computed against it
+    base, ext = os.path.splitext(hlr3_file)
+    return f'{base}.prev{ext}'
+
+
+def delta_files(hlr3_file: str) -> Tuple[str, str]:
+    """
+    :return: (delta file, removed file) that belong to a hlr3 file
+    """
+    base, ext = os.path.splitext(hlr3_file)
+    return f'{base}.delta{ext}', f'{base}.removed{ext}'
+
+
+def compute_delta(previous_file: str, current_file: str) -> DeltaResult:
+    """
+    Compare two hlr3 files by dnis and write the delta files of the current one.
+    The delta file gets the current lines of added and changed numbers (mccmnc or ownerID differ),
+    the removed file gets dnis of numbers that are not in the current file anymore.
+    active_from alone does not make a change, some sources stamp every row with the run time
+    """
+    logger.info(f'computing delta {previous_file} -> {current_file}')
+    delta_file, removed_file = delta_files(current_file)
+    delta_result = DeltaResult()
+
+    # dnis -> "mccmnc;ownerID", values repeat a lot so they are interned
+    previous = {}
+    if os.path.exists(previous_file):
+        with open(previous_file, 'r', newline='') as f:
+            for line in f:
+                dnis, mccmnc, _, owner_id, _ = line.split(';', 4)
+                previous[dnis] = sys.intern(f'{mccmnc};{owner_id}')
+
+    with open(current_file, 'r', newline='') as in_f, open(delta_file, 'w', newline='') as delta_f:
+        for line in in_f:
+            dnis, mccmnc, _, owner_id, _ = line.split(';', 4)
+            previous_value = previous.pop(dnis, None)
+            if previous_value is None:
+                delta_result.added += 1
+            elif previous_value != f'{mccmnc};{owner_id}':
+                delta_result.changed += 1
+            else:
+                continue
+
+            delta_f.write(line)
+
+    with open(removed_file, 'w', newline='') as removed_f:
+        for dnis in previous:
+            removed_f.write(f'{dnis}\n')
+
+        delta_result.removed = len(previous)
+
+    logger.info(
+        f'delta of {current_file}: added {delta_result.added}, changed {delta_result.changed}, '
+        f'removed {delta_result.removed}',
+    )
+    return delta_result
+
+
+def commit_delta(hlr3_file: str) -> None:
+    """
+    Mark the current hlr3 file as loaded into HLR3: it becomes the snapshot for the next delta
+    and its delta files are dropped, so they are not sent again
+    """
+    snapshot = snapshot_file(hlr3_file)
+    logger.debug(f'advance snapshot {snapshot}')
+    # left over by an interrupted run
+    try:
+        os.remove(f'{snapshot}.tmp')
+    except FileNotFoundError:
+        pass
+
+    # the hlr3 file is always replaced by a new one, never rewritten in place, so a hard link is enough
+    os.link(hlr3_file, f'{snapshot}.tmp')
+    os.replace(f'{snapshot}.tmp', snapshot)
+    for file in delta_files(hlr3_file):
+        os.remove(file)
@@ -7,3 +7,17 @@ class GetFileError(BaseError):
     Raised when could not get file for parsing
     """
     pass
+
+
+class FileNotChangedError(GetFileError):
+    """
+    Raised when the source has no new file since the last processed one
+    """
+    pass
+
+
+class Hlr3LoadError(BaseError):
+    """
+    Raised when HLR3 rejected a Mnp.Update call
+    """
+    pass
@@ -1,22 +1,90 @@
 # import csv
+import contextlib
 import ftplib
+import functools
+import io
 import os
 
-from typing import Protocol
+from dataclasses import dataclass
+from typing import ContextManager, Dict, List, Optional, Protocol, Tuple, Union
 from zipfile import ZipFile
 
 from config import settings
-from error.errors import GetFileError
+from delta import commit_delta, delta_files, snapshot_file
+from error.errors import FileNotChangedError, GetFileError
+from file_handlers.ftp_cache import FtpFileCache
 from logger_config import configure_logger
-from parsers.parser import AvailableCountry
-from utils import get_latest_file_from_ftp, download_file, get_country_prefix
+from parsers.parser import AvailableCountry, MnpSource
+from utils import (
+    JoinResult,
+    close_ftp,
+    concatenate_files,
+    connect_ftp,
+    download_file,
+    get_country_prefix,
+    get_latest_entry_from_ftp,
+)
 
 logger = configure_logger(__name__)
 
 
+@functools.cache
+def get_ftp_cache() -> FtpFileCache:
+    """
+    Cache of the fetched FTP files, built on first use: importing the module does not read the settings
+    :return: FtpFileCache of FTP_CACHE_FILE
+    """
+    return FtpFileCache(settings.ftp_cache_file)
+
+
+@dataclass(frozen=True)
+class ZipMember:
+    """
+    Member of a downloaded zip file that is parsed as a stream instead of being extracted
+    """
+    zip_file: str
+    name: str
+
+    def open(self) -> io.TextIOWrapper:
+        with ZipFile(self.zip_file, 'r') as zip_f:
+            # the member keeps the underlying file open after the ZipFile is closed
+            return io.TextIOWrapper(zip_f.open(self.name))
+
+
+# what get_file returns: path of a raw mnp file or a member of a downloaded zip file
+RawMnpFile = Union[str, ZipMember]
+
+
+def open_source(raw_mnp_file: RawMnpFile) -> ContextManager[MnpSource]:
+    if isinstance(raw_mnp_file, ZipMember):
+        return raw_mnp_file.open()
+
+    return contextlib.nullcontext(raw_mnp_file)
+
+
+def _get_size(facts: Dict[str, str]) -> Optional[int]:
+    return int(facts['size']) if 'size' in facts else None
+
+
+def get_local_file(raw_mnp_file: RawMnpFile) -> str:
+    """
+    :return: file on disk that holds the raw mnp data, to be archived and removed
+    """
+    if isinstance(raw_mnp_file, ZipMember):
+        return raw_mnp_file.zip_file
+
+    return raw_mnp_file
+
+
 class FileHandler(Protocol):
 
-    def get_file(self) -> str:
+    def get_file(self) -> RawMnpFile:
+        pass
+
+    def mark_processed(self) -> None:
+        """
+        Called once the file from get_file was parsed and saved
+        """
         pass
 
     # def save_parse_result(self, parsed_result: ParseResult) -> None:
@@ -24,38 +92,54 @@ class FileHandler(Protocol):
 
 
 class GeorgiaFileHandler:
+    latest_entry: Optional[Tuple[str, Dict[str, str]]] = None
 
-    def get_file(self) -> str:
+    def get_file(self) -> RawMnpFile:
         """
         Get a file from FTP
-        :return: path of the extracted file
+        :return: path of the extracted file or the zip member when STREAM_ZIP is set
         """
-        ftp = ftplib.FTP()
+        ftp = self._connect()
+
+        latest_file, facts = get_latest_entry_from_ftp(ftp)
+        if get_ftp_cache().is_fetched(settings.georgia_settings.file_prefix, latest_file, facts):
+            close_ftp(ftp)
+            logger.info(f'no new file on {settings.georgia_settings.ftp_server} since {latest_file}, skip it')
+            raise FileNotChangedError
+
         try:
-            ftp.connect(
-                settings.georgia_settings.ftp_server,
-                settings.georgia_settings.ftp_port,
-                timeout=20,
-            )
-            ftp.login(settings.georgia_settings.ftp_user, settings.georgia_settings.ftp_password)
-        except TimeoutError as err:
-            logger.error(
-                f'could not connect to {settings.georgia_settings.ftp_server}:{settings.georgia_settings.ftp_port}',
+            zip_file = download_file(
+                latest_file,
+                ftp,
+                size=_get_size(facts),
+                connect=self._connect,
+                modified=facts.get('modify'),
             )
-            raise GetFileError() from err
+        finally:
+            close_ftp(ftp)
 
-        latest_file = get_latest_file_from_ftp(ftp)
-        zip_file = download_file(latest_file, ftp=ftp)
-        ftp.quit()
+        self.latest_entry = latest_file, facts
         with ZipFile(zip_file, 'r') as zip_ref:
-            raw_mnp_file = os.path.join(settings.tmp_directory, zip_ref.namelist()[0])
-            zip_ref.extractall(settings.georgia_settings.tmp_directory)
+            raw_mnp_file_name = zip_ref.namelist()[0]
+            if settings.stream_zip:
+                logger.info(f'stream {raw_mnp_file_name} from {zip_file}')
+                return ZipMember(str(zip_file), raw_mnp_file_name)
+
+            raw_mnp_file = os.path.join(settings.tmp_directory, raw_mnp_file_name)
+            zip_ref.extract(raw_mnp_file_name, settings.tmp_directory)
 
         logger.info(f'extracted {raw_mnp_file}')
         logger.info(f'remove zip file: {zip_file}')
         os.remove(zip_file)
         return raw_mnp_file
 
+    def mark_processed(self) -> None:
+        if self.latest_entry is not None:
+            get_ftp_cache().store(settings.georgia_settings.file_prefix, *self.latest_entry)
+
+    def _connect(self) -> ftplib.FTP:
+        return connect_ftp(settings.georgia_settings)
+
     # def save_parse_result(self, parsed_result: ParseResult) -> None:
     #     hlr3_fields = ('dnis', 'mccmnc', 'active_from', 'ownerID', 'providerResponseCode')
     #     ftp_fields = ('dnis', 'mccmnc')
@@ -74,23 +158,35 @@ class GeorgiaFileHandler:
 
 
 class KazakhstanFileHandler:
+    latest_entry: Optional[Tuple[str, Dict[str, str]]] = None
+
+    def get_file(self) -> RawMnpFile:
+        ftp = self._connect()
+
+        latest_file, facts = get_latest_entry_from_ftp(ftp)
+        if get_ftp_cache().is_fetched(settings.kazakhstan_settings.file_prefix, latest_file, facts):
+            close_ftp(ftp)
+            logger.info(f'no new file on {settings.kazakhstan_settings.ftp_server} since {latest_file}, skip it')
+            raise FileNotChangedError
 
-    def get_file(self) -> str:
-        ftp = ftplib.FTP()
         try:
-            ftp.connect(host=settings.kazakhstan_settings.ftp_server, port=settings.kazakhstan_settings.ftp_port)
-            ftp.login(user=settings.kazakhstan_settings.ftp_user, passwd=settings.kazakhstan_settings.ftp_password)
-        except TimeoutError as err:
-            logger.error(
-                f'could not connect to {settings.georgia_settings.ftp_server}:{settings.georgia_settings.ftp_port}',
+            zip_file = download_file(
+                latest_file,
+                ftp,
+                size=_get_size(facts),
+                connect=self._connect,
+                modified=facts.get('modify'),
             )
-            raise GetFileError() from err
+        finally:
+            close_ftp(ftp)
 
-        latest_file = get_latest_file_from_ftp(ftp)
-        zip_file = download_file(latest_file, ftp)
-        ftp.quit()
+        self.latest_entry = latest_file, facts
         with ZipFile(zip_file, 'r') as zip_f:
             raw_mnp_file_name = zip_f.namelist()[0]
+            if settings.stream_zip:
+                logger.info(f'stream {raw_mnp_file_name} from {zip_file}')
+                return ZipMember(str(zip_file), raw_mnp_file_name)
+
             raw_mnp_file = os.path.join(settings.tmp_directory, raw_mnp_file_name)
             zip_f.extract(raw_mnp_file_name, settings.tmp_directory)
 
@@ -99,6 +195,13 @@ class KazakhstanFileHandler:
         logger.info(f'remove zip file: {zip_file}')
         return os.path.join(settings.tmp_directory, raw_mnp_file_name)
 
+    def mark_processed(self) -> None:
+        if self.latest_entry is not None:
+            get_ftp_cache().store(settings.kazakhstan_settings.file_prefix, *self.latest_entry)
+
+    def _connect(self) -> ftplib.FTP:
+        return connect_ftp(settings.kazakhstan_settings)
+
     # def save_parse_result(self, parsed_result: ParseResult) -> None:
     #     logger.info('start save parse result')
     #
@@ -138,6 +241,10 @@ class BelarusFileHandler:
         logger.info(f'source mnp file: {source_file}')
         return source_file
 
+    def mark_processed(self) -> None:
+        # the source file is removed once processed
+        pass
+
     # def save_parse_result(self, parsed_result: ParseResult) -> None:
     #     logger.info('start save parse result')
     #
@@ -175,6 +282,10 @@ class LatviaFileHandler:
         logger.info(f'source mnp file: {source_file}')
         return source_file
 
+    def mark_processed(self) -> None:
+        # the source file is removed once processed
+        pass
+
     # def save_parse_result(self, parsed_result: ParseResult) -> None:
     #     logger.info('start save parse result')
     #
@@ -196,25 +307,69 @@ class LatviaFileHandler:
     #         csv_writer.writerows(parsed_result.hlr3_records)
 
 
-def join_all_files():
+def join_all_files() -> JoinResult:
     logger.info('Start joining all files')
     full_file = settings.full_hlr_file
     logger.info(f'full_file: {full_file}')
-    hlr3_records = []
+    hlr3_files = []
     for country in AvailableCountry:
         prefix = get_country_prefix(country)
         hlr3_file = os.path.join(settings.hlr_directory, prefix, f'{prefix}.csv')
         logger.info(f'join {hlr3_file}')
-        try:
-            with open(hlr3_file, 'r') as hlr3_file:
-                hlr3_records.extend(hlr3_file.readlines())
-        except FileNotFoundError:
+        if not os.path.exists(hlr3_file):
             logger.error(f'Could not find {hlr3_file}')
-
-    with open(full_file, 'w') as full_hlr_file:
-        full_hlr_file.writelines(hlr3_records)
-
-    logger.info('Finish joining all files')
+            continue
+
+        hlr3_files.append(hlr3_file)
+
+    join_result = concatenate_files(hlr3_files, full_file, count_lines=True)
+    logger.info(
+        f'Finish joining all files: {join_result.files} files, {join_result.bytes} bytes, {join_result.lines} lines',
+    )
+    return join_result
+
+
+def join_all_delta_files() -> List[str]:
+    """
+    Join delta and removed files of all countries next to the full hlr file.
+    A delta computed without a snapshot holds no removed numbers, then no joined delta is written
+    and the next load has to replace all numbers
+    :return: hlr3 files whose delta was computed
+    """
+    logger.info('Start joining all delta files')
+    full_delta_file, full_removed_file = delta_files(settings.full_hlr_file)
+    hlr3_files = []
+    for country in AvailableCountry:
+        prefix = get_country_prefix(country)
+        hlr3_file = os.path.join(settings.hlr_directory, prefix, f'{prefix}.csv')
+        if not os.path.exists(delta_files(hlr3_file)[0]):
+            logger.info(f'no delta for {hlr3_file}')
+            continue
+
+        hlr3_files.append(hlr3_file)
+
+    without_snapshot = [hlr3_file for hlr3_file in hlr3_files if not os.path.exists(snapshot_file(hlr3_file))]
+    if without_snapshot:
+        logger.warning(f'no snapshot of {without_snapshot}, the next hlr3 load is a full one')
+        for file in (full_delta_file, full_removed_file):
+            try:
+                os.remove(file)
+            except FileNotFoundError:
+                pass
+
+        return hlr3_files
+
+    logger.info(f'join delta of {hlr3_files} into {full_delta_file}, {full_removed_file}')
+    concatenate_files([delta_files(hlr3_file)[0] for hlr3_file in hlr3_files], full_delta_file)
+    concatenate_files([delta_files(hlr3_file)[1] for hlr3_file in hlr3_files], full_removed_file)
+    logger.info('Finish joining all delta files')
+    return hlr3_files
+
+
+def commit_all_delta_files(hlr3_files: List[str]) -> None:
+    # called once the joined delta or the full hlr file was pushed and, with HLR3_LOAD, loaded
+    for hlr3_file in hlr3_files:
+        commit_delta(hlr3_file)
 
 
 def get_file_handler(country: AvailableCountry) -> FileHandler:
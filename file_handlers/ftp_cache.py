@@ -0,0 +1,50 @@
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Dict
+
+from logger_config import configure_logger
+
+logger = configure_logger(__name__)
+
+
+class FtpFileCache:
+    """
+    Persistent cache of the last fetched FTP file per country: name, size and modify MLSD facts
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(self, cache_file: str):
+        self.cache_file = cache_file
+
+    def is_fetched(self, file_prefix: str, file_name: str, facts: Dict[str, str]) -> bool:
+        entry = self._load().get(file_prefix, {})
+        return all(entry.get(key) == value for key, value in self._entry(file_name, facts).items())
+
+    def store(self, file_prefix: str, file_name: str, facts: Dict[str, str]) -> None:
+        with self._lock:
+            cache = self._load()
+            cache[file_prefix] = self._entry(file_name, facts) | {'fetched_at': datetime.now().isoformat()}
+            tmp_cache_file = f'{self.cache_file}.tmp'
+            with open(tmp_cache_file, 'w') as f:
+                json.dump(cache, f, indent=2)
+
+            os.replace(tmp_cache_file, self.cache_file)
+
+        logger.debug(f'stored {file_prefix} ftp file {file_name} in {self.cache_file}')
+
+    def _load(self) -> Dict[str, Dict[str, str]]:
+        try:
+            with open(self.cache_file, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            logger.warning(f'broken ftp cache file {self.cache_file}, ignore it')
+            return {}
+
+    @staticmethod
+    def _entry(file_name: str, facts: Dict[str, str]) -> Dict[str, str]:
+        return {'file': file_name, 'size': facts.get('size'), 'modify': facts.get('modify')}
@@ -0,0 +1,249 @@
+"""
+HLR3 load stage: the full hlr file (with the refbook numbers) or its delta is loaded into HLR3 by Mnp.Update
+JSON-RPC calls. Mnp.Update reads the file it gets the path of, so the files are split into batch files
+that HLR3 must be able to read (HLR3_BATCH_DIRECTORY on the HLR3 host).
+A full load is a single replaceAll call with one file, so HLR3 never holds a part of the numbers.
+Delta batches only add numbers and are loaded concurrently, every worker thread keeps its HTTP connection open
+between batches
+"""
+import csv
+import http.client
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, TextIO
+from urllib.parse import urlsplit
+
+from config import settings
+from delta import delta_files
+from error.errors import Hlr3LoadError
+from logger_config import configure_logger
+from utils import concatenate_files
+
+logger = configure_logger(__name__)
+
+
+@dataclass
+class LoadResult:
+    batches: int = 0
+    handled_lines: int = 0
+    successfully_lines: int = 0
+
+    def add(self, other: 'LoadResult') -> None:
+        self.batches += other.batches
+        self.handled_lines += other.handled_lines
+        self.successfully_lines += other.successfully_lines
+
+
+def convert_refbook(hlr2_file: str, hlr3_file: str, active_from: Optional[int] = None) -> int:
+    """
+    Convert the HLR2 refbook (DIAL_CODE;MCC_MNC with a header line) into HLR3 lines active from active_from
+    :return: number of lines written
+    """
+    active_from = active_from if active_from is not None else int(time.time())
+    lines = 0
+    with open(hlr2_file, 'r', newline='') as in_f, open(hlr3_file, 'w', newline='') as out_f:
+        next(in_f, None)
+        writer = csv.writer(out_f, delimiter=';')
+        for row in csv.reader(in_f, delimiter=';', quotechar='"'):
+            if not row:
+                continue
+
+            writer.writerow((row[0], row[1], active_from, None, None))
+            lines += 1
+
+    return lines
+
+
+def write_batches(sources: Iterable[str], batch_lines: int, batch_prefix: str) -> List[str]:
+    """
+    Stream the lines of sources into files batch_prefix.<n> of at most batch_lines lines
+    :return: batch files in order
+    """
+    batch_files: List[str] = []
+    out_f: Optional[TextIO] = None
+    written = batch_lines
+    try:
+        for source in sources:
+            with open(source, 'r', newline='') as in_f:
+                for line in in_f:
+                    if written == batch_lines:
+                        if out_f is not None:
+                            out_f.close()
+
+                        batch_files.append(f'{batch_prefix}.{len(batch_files)}')
+                        out_f = open(batch_files[-1], 'w', newline='')
+                        written = 0
+
+                    out_f.write(line)
+                    written += 1
+    except BaseException:
+        remove_batches(batch_files)
+        raise
+    finally:
+        if out_f is not None:
+            out_f.close()
+
+    return batch_files
+
+
+def remove_batches(batch_files: Iterable[str]) -> None:
+    for batch_file in batch_files:
+        try:
+            os.remove(batch_file)
+        except FileNotFoundError:
+            pass
+
+
+class Hlr3Loader:
+    """
+    Mnp.Update client, calls go to url from up to concurrency threads with a kept alive connection each
+    """
+
+    def __init__(self, url: str, concurrency: int = 1, timeout: float = 3600):
+        self.url = urlsplit(url)
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connections: List[http.client.HTTPConnection] = []
+        self._lock = threading.Lock()
+
+    def load(self, batch_files: List[str]) -> LoadResult:
+        """
+        Add the numbers of the batch files to HLR3, the batches are loaded concurrently
+        :return: aggregated result of all batches
+        """
+        load_result = LoadResult()
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                futures = [
+                    executor.submit(self._update, batch_file, False, number, len(batch_files))
+                    for number, batch_file in enumerate(batch_files, start=1)
+                ]
+                for future in futures:
+                    load_result.add(future.result())
+
+        finally:
+            self._close()
+
+        return load_result
+
+    def replace_all(self, file_path: str) -> LoadResult:
+        """
+        Replace all numbers in HLR3 with the ones of file_path in one call, HLR3 swaps them at once
+        :return: result of the call
+        """
+        try:
+            return self._update(file_path, True, 1, 1)
+        finally:
+            self._close()
+
+    def _update(self, file_path: str, replace_all: bool, number: int, total: int) -> LoadResult:
+        started = time.perf_counter()
+        result = self._call('Mnp.Update', {
+            'filePath': file_path,
+            'replaceAll': replace_all,
+            'skipFirstLine': False,
+            'force': True,
+            'diffRequest': False,
+        })
+        batch_result = LoadResult(1, result['handledLines'], result['successfullyLines'])
+        logger.info(
+            f'hlr3 batch {number}/{total} loaded in {time.perf_counter() - started:.1f}s: '
+            f'handledLines {batch_result.handled_lines}, successfullyLines {batch_result.successfully_lines}',
+        )
+        return batch_result
+
+    def _call(self, method: str, params: dict) -> dict:
+        body = json.dumps({'method': method, 'params': params, 'id': 999, 'jsonrpc': '2.0'})
+        headers = {'Accept': 'application/json', 'Content-Type': 'application/json'}
+        path = f'{self.url.path}?{self.url.query}' if self.url.query else self.url.path
+        # one retry on a new connection, the server may have closed the kept alive one
+        for attempt in range(2):
+            connection = self._connection()
+            try:
+                connection.request('POST', path or '/', body, headers)
+                response = connection.getresponse()
+                data = response.read()
+                break
+            except (http.client.HTTPException, ConnectionError):
+                connection.close()
+                self._local.connection = None
+                if attempt:
+                    raise
+
+        if response.status != 200:
+            raise Hlr3LoadError(f'{method} failed with HTTP {response.status}: {data[:200]!r}')
+
+        payload = json.loads(data)
+        if payload.get('error'):
+            raise Hlr3LoadError(f'{method} {params.get("filePath")} failed: {payload["error"]}')
+
+        return payload['result']
+
+    def _connection(self) -> http.client.HTTPConnection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = http.client.HTTPConnection(self.url.hostname, self.url.port, timeout=self.timeout)
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+
+        return connection
+
+    def _close(self) -> None:
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+
+            self._connections.clear()
+
+        self._local = threading.local()
+
+
+def load_hlr3(full_load: bool = False) -> LoadResult:
+    """
+    Load the delta of the full hlr file when HLR_DELTA is set and it removes no number,
+    the full hlr file and the converted refbook otherwise
+    :return: aggregated result of all batches
+    """
+    delta_file, removed_file = delta_files(settings.full_hlr_file)
+    batch_prefix = os.path.join(settings.hlr3_batch_directory, 'hlr3_batch')
+    loader = Hlr3Loader(settings.hlr3_load_url, settings.hlr3_load_concurrency)
+
+    # no joined delta is written when a country had no snapshot, its removed numbers are unknown
+    has_delta = os.path.exists(delta_file) and os.path.exists(removed_file)
+    if not full_load and settings.hlr_delta and has_delta and os.path.getsize(removed_file) == 0:
+        logger.info(f'start hlr3 delta load of {delta_file}')
+        batch_files = write_batches([delta_file], settings.hlr3_batch_lines, batch_prefix)
+        try:
+            load_result = loader.load(batch_files)
+        finally:
+            remove_batches(batch_files)
+
+    else:
+        sources = [settings.full_hlr_file]
+        if settings.hlr3_refbook_file:
+            refbook_file = os.path.join(settings.tmp_directory, 'refbook_for_hlr_3.csv')
+            convert_refbook(settings.hlr3_refbook_file, refbook_file)
+            sources.append(refbook_file)
+        else:
+            logger.warning('HLR3_REFBOOK_FILE is not set, the full hlr3 load has no refbook numbers')
+
+        logger.info(f'start hlr3 full load of {sources}')
+        # one file for one replaceAll call, batches loaded one after another would leave HLR3 partial
+        full_load_file = f'{batch_prefix}.full'
+        concatenate_files(sources, full_load_file)
+        try:
+            load_result = loader.replace_all(full_load_file)
+        finally:
+            remove_batches([full_load_file])
+
+    logger.info(
+        f'mnp load result: {load_result.batches} batches, handledLines - {load_result.handled_lines}, '
+        f'successfullyLines - {load_result.successfully_lines}',
+    )
+    return load_result
@@ -1,6 +1,8 @@
 # python 2.6
 import csv
 import json
+import os
+import sys
 import urllib2
 import time
 import urllib
@@ -72,17 +74,35 @@ def join_files(final_file, *args):
                 f.write(f_in.read())
 
 
+def can_load_delta(hlr3_file, hlr3_delta_file, hlr3_removed_file):
+    # delta has to come from the same push as the full file and can not remove numbers,
+    # Mnp.Update without replaceAll only adds and updates.
+    # No delta is pushed when a country had no previous snapshot, the delta left by an earlier push
+    # is older than the full file then and the full file replaces all numbers
+    for file_path in (hlr3_delta_file, hlr3_removed_file):
+        if not os.path.exists(file_path) or os.path.getmtime(file_path) < os.path.getmtime(hlr3_file):
+            return False
+
+    return os.path.getsize(hlr3_removed_file) == 0
+
+
 def main():
     tg_token = ''
     tg_chat_id = ''
     hlr3_for_load = '/tmp/hlr3_for_load.csv'
     hlr3_file = '/tmp/hlr3_full.csv'
+    hlr3_delta_file = '/tmp/hlr3_full.delta.csv'
+    hlr3_removed_file = '/tmp/hlr3_full.removed.csv'
     hlr3_dial_code = '/tmp/refbook_for_hlr_3.csv'
     dial_code_file = '/u01/app/oracle/invoice.files/refbook_for_hlr_2.csv'
 
-    convert_hlr2_to_hlr3(dial_code_file, hlr3_dial_code)
-    join_files(hlr3_for_load,  hlr3_file, hlr3_dial_code)
-    load_result = load_hlr3_data(hlr3_for_load, True)
+    if '--full' not in sys.argv and can_load_delta(hlr3_file, hlr3_delta_file, hlr3_removed_file):
+        load_result = load_hlr3_data(hlr3_delta_file, False)
+    else:
+        convert_hlr2_to_hlr3(dial_code_file, hlr3_dial_code)
+        join_files(hlr3_for_load,  hlr3_file, hlr3_dial_code)
+        load_result = load_hlr3_data(hlr3_for_load, True)
+
     load_result = json.loads(load_result)
     message = 'mnp load result: handledLines - {0}, successfullyLines - {1}'.format(
         load_result['result']['handledLines'],
@@ -0,0 +1,131 @@
+import heapq
+import os
+import tempfile
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Tuple
+
+from logger_config import configure_logger
+
+logger = configure_logger(__name__)
+
+# spill files merged at once, more of them are merged in several passes
+MAX_MERGE_FILES = 128
+
+# (dnis, -active_from, -chunk, line), sorting by it puts the record that wins for a dnis first
+SortKey = Tuple[str, int, int, str]
+
+
+@dataclass
+class SortResult:
+    lines_read: int = 0
+    lines_written: int = 0
+    spill_files: int = 0
+
+
+def sort_hlr_file(source: str, destination: str, buffer_lines: int, tmp_directory: str) -> SortResult:
+    """
+    Sort a hlr3 file by dnis and keep one line per dnis, the one with the latest active_from
+    (the one that comes later in the source when active_from is equal).
+    External merge sort: at most buffer_lines lines are held in memory, sorted runs are spilled
+    into tmp_directory. destination may be the source itself, it is replaced atomically
+    """
+    logger.info(f'start sorting {source} into {destination}')
+    sort_result = SortResult()
+    spill_files = []
+    try:
+        with open(source, 'r', newline='') as f:
+            for chunk, lines in enumerate(_read_chunks(f, buffer_lines)):
+                sort_result.lines_read += len(lines)
+                spill_files.append(_spill(_deduplicate(sorted(_keys(lines, chunk))), tmp_directory))
+
+        sort_result.spill_files = len(spill_files)
+        while len(spill_files) > MAX_MERGE_FILES:
+            groups = [spill_files[i:i + MAX_MERGE_FILES] for i in range(0, len(spill_files), MAX_MERGE_FILES)]
+            merged_files = [_spill(_merge(group), tmp_directory) for group in groups]
+            _remove_files(spill_files)
+            spill_files = merged_files
+
+        tmp_destination = f'{destination}.tmp'
+        with open(tmp_destination, 'w', newline='') as out_f:
+            for key in _merge(spill_files):
+                out_f.write(key[3])
+                sort_result.lines_written += 1
+
+        os.replace(tmp_destination, destination)
+    finally:
+        _remove_files(spill_files)
+
+    logger.info(
+        f'finish sorting {source}: {sort_result.lines_read} lines read, {sort_result.lines_written} written, '
+        f'{sort_result.spill_files} spill files',
+    )
+    return sort_result
+
+
+def _read_chunks(lines: Iterable[str], buffer_lines: int) -> Iterator[List[str]]:
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= buffer_lines:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
+
+
+def _keys(lines: Iterable[str], chunk: int) -> Iterator[SortKey]:
+    for position, line in enumerate(lines):
+        if not line.endswith('\n'):
+            line += '\n'
+
+        dnis, _, active_from, _ = line.split(';', 3)
+        try:
+            active_from = int(active_from)
+        except ValueError:
+            active_from = -1
+        # position breaks ties inside a chunk: the later line wins
+        yield dnis, -active_from, -(chunk * (1 << 32) + position), line
+
+
+def _deduplicate(keys: Iterable[SortKey]) -> Iterator[SortKey]:
+    last_dnis = None
+    for key in keys:
+        if key[0] != last_dnis:
+            last_dnis = key[0]
+            yield key
+
+
+def _spill(keys: Iterable[SortKey], tmp_directory: str) -> str:
+    # spill line: tie breaker;original line, dnis and active_from are parsed again from the line
+    fd, spill_file = tempfile.mkstemp(prefix='hlr_sort_', suffix='.spill', dir=tmp_directory)
+    with open(fd, 'w', newline='') as f:
+        for key in keys:
+            f.write(f'{key[2]};{key[3]}')
+
+    return spill_file
+
+
+def _read_spill(spill_file: str) -> Iterator[SortKey]:
+    with open(spill_file, 'r', newline='') as f:
+        for spill_line in f:
+            order, line = spill_line.split(';', 1)
+            dnis, _, active_from, _ = line.split(';', 3)
+            try:
+                active_from = int(active_from)
+            except ValueError:
+                active_from = -1
+
+            yield dnis, -active_from, int(order), line
+
+
+def _merge(spill_files: List[str]) -> Iterator[SortKey]:
+    return _deduplicate(heapq.merge(*(_read_spill(spill_file) for spill_file in spill_files)))
+
+
+def _remove_files(files: List[str]) -> None:
+    for file in files:
+        try:
+            os.remove(file)
+        except FileNotFoundError:
+            pass
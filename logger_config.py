@@ -1,12 +1,35 @@
+import atexit
 import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from multiprocessing import util
+from typing import Optional
 
 from config import log_settings
 
+# every logger hands its records to one queue handler, a single listener thread writes them
+# with the shared file and stream handlers, so logging calls never wait for disk or terminal
+_queue_handler: Optional[QueueHandler] = None
+_listener: Optional[QueueListener] = None
+
 
 def configure_logger(name: str):
     logger = logging.getLogger(name)
     logger.setLevel(log_settings.log_level)
 
+    if _queue_handler is None:
+        _start_logging()
+
+    if _queue_handler not in logger.handlers:
+        logger.addHandler(_queue_handler)
+
+    return logger
+
+
+def _start_logging() -> None:
+    global _queue_handler
+
     file_handler = logging.FileHandler(log_settings.log_file)
     stream_handler = logging.StreamHandler()
 
@@ -17,6 +40,36 @@ def configure_logger(name: str):
     file_handler.setFormatter(formatter)
     stream_handler.setFormatter(formatter)
 
-    logger.addHandler(file_handler)
-    logger.addHandler(stream_handler)
-    return logger
+    _queue_handler = QueueHandler(queue.SimpleQueue())
+    _start_listener(file_handler, stream_handler)
+    atexit.register(_stop_listener)
+    # the listener thread does not survive a fork, worker processes get their own
+    os.register_at_fork(after_in_child=_restart_listener)
+    # multiprocessing workers leave by os._exit and skip atexit, the finalizers they register after the fork still run
+    util.register_after_fork(_queue_handler, _stop_listener_at_exit)
+
+
+def _start_listener(*handlers: logging.Handler) -> None:
+    global _listener
+    _listener = QueueListener(_queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def _restart_listener() -> None:
+    if _listener is None:
+        return
+    # records queued in the parent before the fork are written by the parent
+    _queue_handler.queue = queue.SimpleQueue()
+    _start_listener(*_listener.handlers)
+
+
+def _stop_listener_at_exit(_) -> None:
+    util.Finalize(None, _stop_listener, exitpriority=-100)
+
+
+def _stop_listener() -> None:
+    # writes the records still queued
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
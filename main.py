@@ -1,62 +1,130 @@
+import argparse
+import asyncio
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Optional
 
 from config import settings
-from error.errors import GetFileError
+from delta import delta_files
 from logger_config import configure_logger
-from file_handlers.file_handler import get_file_handler, join_all_files
-from parsers.parser import get_parser, AvailableCountry
-from utils import archive_file, push_file_to_server, save_parse_result
+from metrics import RunMetrics
+from hlr_sorter import sort_hlr_file
+from hlr3_load import load_hlr3
+from file_handlers.file_handler import commit_all_delta_files, get_file_handler, join_all_delta_files, join_all_files
+from parsers.parser import AvailableCountry
+from pipeline import Pipeline, parse_country
+from routing import build_snapshot
+from profiler import enable_profiling, profile_stage
+from utils import archive_file, push_files_to_server
 
 logger = configure_logger(__name__)
 
 
-def main() -> None:
+def main(full_load: bool = False, countries: Optional[Iterable[AvailableCountry]] = None) -> None:
+    """
+    :param countries: countries to download and parse, all by default.
+    The full hlr file is joined from the current hlr files of all countries either way
+    """
     logger.info('starting main application')
-    for country in AvailableCountry:
-
-        try:
-            logger.info(f'starting handling country: {country.name}')
-            parser = get_parser(country)
-            file_handler = get_file_handler(country)
-            try:
-                raw_mnp_file = file_handler.get_file()
-            except GetFileError:
-                continue
-
-            parse_result = parser.parse(raw_mnp_file)
-            if len(parse_result.hlr_records) == 0 or len(parse_result.hlr3_records) == 0:
-                logger.warning(f'Check parse result for {country.name}')
-                continue
-
-            archive_file(raw_mnp_file, country.name)
-            logger.debug(f'remove raw mnp file: {raw_mnp_file}')
-            os.remove(raw_mnp_file)
-
-            save_parse_result(parse_result, country)
-        except Exception as e:
-            logger.exception(e, exc_info=True)
-        finally:
-            logger.info(f'finished handling country: {country.name}')
-
-    logger.info('Archive full hlr file')
-    archive_file(settings.full_hlr_file, 'full_hlr')
-    join_all_files()
-    push_file_to_server(settings.smssw_server,
-                        22,
-                        settings.full_hlr_file,
-                        settings.smssw_full_hlr_file_path)
+    run_metrics = RunMetrics()
+    try:
+        run(run_metrics, full_load, countries)
+    finally:
+        run_metrics.finish()
+        if settings.metrics_directory:
+            run_metrics.write(settings.metrics_directory)
+
+
+def run(
+        run_metrics: RunMetrics,
+        full_load: bool = False,
+        countries: Optional[Iterable[AvailableCountry]] = None,
+) -> None:
+    countries = AvailableCountry if countries is None else countries
+    # the previous full hlr file is only replaced by the join, it is archived in the background meanwhile
+    with ThreadPoolExecutor(max_workers=1) as archive_pool:
+        logger.info('Archive full hlr file')
+        full_hlr_archived = archive_pool.submit(archive_file, settings.full_hlr_file, 'full_hlr')
+        asyncio.run(Pipeline(settings.max_workers, settings.max_pending_files, run_metrics).run(countries))
+        full_hlr_archived.result()
+
+    with profile_stage('join'):
+        join_result = join_all_files()
+        if settings.sort_full_hlr:
+            sort_hlr_file(
+                settings.full_hlr_file,
+                settings.full_hlr_file,
+                settings.sort_buffer_lines,
+                settings.tmp_directory,
+            )
+
+        if settings.hlr_delta:
+            delta_hlr3_files = join_all_delta_files()
+
+    run_metrics.join_files = join_result.files
+    run_metrics.join_bytes = join_result.bytes
+    run_metrics.join_lines = join_result.lines
+    if settings.routing_snapshot_file:
+        with profile_stage('routing_snapshot'):
+            build_snapshot(settings.full_hlr_file, settings.hlr3_refbook_file, settings.routing_snapshot_file)
+
+    pushed_files = [(settings.full_hlr_file, settings.smssw_full_hlr_file_path)]
+    # no joined delta when a country had no snapshot yet, the stale remote delta is older than the full file then
+    if settings.hlr_delta and os.path.exists(delta_files(settings.full_hlr_file)[0]):
+        pushed_files.extend(zip(delta_files(settings.full_hlr_file), delta_files(settings.smssw_full_hlr_file_path)))
+
+    started = time.perf_counter()
+    with profile_stage('push'):
+        run_metrics.push_bytes = push_files_to_server(settings.smssw_server, 22, pushed_files)
+
+    run_metrics.push_seconds = time.perf_counter() - started
+
+    if settings.hlr3_load:
+        started = time.perf_counter()
+        with profile_stage('hlr3_load'):
+            load_result = load_hlr3(full_load)
+
+        run_metrics.hlr3_load_seconds = time.perf_counter() - started
+        run_metrics.hlr3_batches = load_result.batches
+        run_metrics.hlr3_handled_lines = load_result.handled_lines
+        run_metrics.hlr3_successfully_lines = load_result.successfully_lines
+
+    # with HLR3_LOAD the snapshots advance after the confirmed load, without it after the push:
+    # the loader on the SMSSW side loads the pushed delta or, when it is missing or stale, the full file
+    if settings.hlr_delta:
+        commit_all_delta_files(delta_hlr3_files)
 
 
 def main_test():
     file_handler = get_file_handler(country=AvailableCountry.Belarus)
     raw_mnp_file = file_handler.get_file()
-    parser = get_parser(country=AvailableCountry.Belarus)
-    parse_result = parser.parse(raw_mnp_file)
+    parse_country(AvailableCountry.Belarus, raw_mnp_file)
     archive_file(raw_mnp_file, AvailableCountry.Belarus.name)
     os.remove(raw_mnp_file)
-    file_handler.save_parse_result(parse_result)
 
 
 if __name__ == '__main__':
-    main()
+    arg_parser = argparse.ArgumentParser(description='Download, parse and push MNP files of all countries')
+    arg_parser.add_argument(
+        '--profile',
+        metavar='DIRECTORY',
+        help='write cProfile stats and tracemalloc summaries of every stage into DIRECTORY',
+    )
+    arg_parser.add_argument(
+        '--full-load',
+        action='store_true',
+        help='load the full hlr file into HLR3 even when a delta load is possible (with HLR3_LOAD)',
+    )
+    arg_parser.add_argument(
+        '--country',
+        action='append',
+        choices=list(AvailableCountry.__members__),
+        help='download and parse only this country, can be repeated',
+    )
+    args = arg_parser.parse_args()
+    if args.profile:
+        enable_profiling(args.profile)
+
+    main(args.full_load, args.country and [AvailableCountry[name] for name in args.country])
     # main_test()
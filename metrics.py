@@ -0,0 +1,165 @@
+import json
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from logger_config import configure_logger
+
+logger = configure_logger(__name__)
+
+# country status values, exported as a label of mnp_country_status
+STATUS_PENDING = 'pending'
+STATUS_OK = 'ok'
+STATUS_NOT_CHANGED = 'not_changed'
+STATUS_EMPTY = 'empty'
+STATUS_FAILED = 'failed'
+
+PROMETHEUS_FILE = 'mnp_parser.prom'
+
+
+@dataclass
+class CountryMetrics:
+    status: str = STATUS_PENDING
+    download_bytes: int = 0
+    download_seconds: float = 0.0
+    # non empty source rows, rows written to the FTP file and rows that did not make it there
+    rows_read: int = 0
+    rows_accepted: int = 0
+    rows_dropped: int = 0
+    # accepted rows without a port date, they are not written to the HLR3 file
+    hlr3_rows_dropped: int = 0
+    parse_seconds: float = 0.0
+    parse_rows_per_second: float = 0.0
+    output_bytes: int = 0
+    archive_bytes: int = 0
+    archive_seconds: float = 0.0
+    # archive size / source size
+    archive_ratio: float = 0.0
+    # error type -> rows of the source with the error
+    row_errors: Dict[str, int] = field(default_factory=dict)
+
+    def record_parse(self, rows_read: int, hlr_records: int, hlr3_records: int, output_bytes: int,
+                     seconds: float, row_errors: Optional[Dict[str, int]] = None) -> None:
+        self.rows_read = rows_read
+        self.rows_accepted = hlr_records
+        self.rows_dropped = max(rows_read - hlr_records, 0)
+        self.hlr3_rows_dropped = hlr_records - hlr3_records
+        self.output_bytes = output_bytes
+        self.parse_seconds = seconds
+        self.parse_rows_per_second = rows_read / seconds if seconds else 0.0
+        self.row_errors = dict(row_errors or {})
+
+    def record_archive(self, source_bytes: int, archive_bytes: int, seconds: float) -> None:
+        self.archive_bytes = archive_bytes
+        self.archive_seconds = seconds
+        self.archive_ratio = archive_bytes / source_bytes if source_bytes else 0.0
+
+
+@dataclass
+class RunMetrics:
+    """
+    Metrics of one main() run: a CountryMetrics per country plus join and push of the full hlr file.
+    Written as a JSON run report and a Prometheus textfile collector file
+    """
+
+    started_at: float = field(default_factory=time.time)
+    duration_seconds: float = 0.0
+    countries: Dict[str, CountryMetrics] = field(default_factory=dict)
+    join_files: int = 0
+    join_bytes: int = 0
+    join_lines: int = 0
+    push_bytes: int = 0
+    push_seconds: float = 0.0
+    hlr3_batches: int = 0
+    hlr3_handled_lines: int = 0
+    hlr3_successfully_lines: int = 0
+    hlr3_load_seconds: float = 0.0
+
+    def country(self, name: str) -> CountryMetrics:
+        return self.countries.setdefault(name, CountryMetrics())
+
+    def finish(self) -> None:
+        self.duration_seconds = time.time() - self.started_at
+
+    def write(self, directory: str) -> Tuple[str, str]:
+        """
+        Write the run report (one file per run) and the Prometheus file (replaced on every run) into directory
+        :return: (json report, prometheus file)
+        """
+        os.makedirs(directory, exist_ok=True)
+        run_time = time.strftime('%Y%m%d-%H%M%S', time.localtime(self.started_at))
+        json_file = os.path.join(directory, f'mnp_run-{run_time}.json')
+        prometheus_file = os.path.join(directory, PROMETHEUS_FILE)
+        _write_atomic(json_file, json.dumps(asdict(self), indent=2))
+        _write_atomic(prometheus_file, self.to_prometheus())
+        logger.info(f'run metrics written to {json_file} and {prometheus_file}')
+        return json_file, prometheus_file
+
+    def to_prometheus(self) -> str:
+        lines: List[str] = []
+        _add_metric(lines, 'mnp_run_timestamp_seconds', 'Start time of the last run', [('', self.started_at)])
+        _add_metric(lines, 'mnp_run_duration_seconds', 'Duration of the last run', [('', self.duration_seconds)])
+        _add_metric(lines, 'mnp_join_files', 'Country files joined into the full hlr file', [('', self.join_files)])
+        _add_metric(lines, 'mnp_join_bytes', 'Size of the full hlr file', [('', self.join_bytes)])
+        _add_metric(lines, 'mnp_join_lines', 'Lines of the full hlr file', [('', self.join_lines)])
+        _add_metric(lines, 'mnp_push_bytes', 'Bytes pushed to the SMSSW server', [('', self.push_bytes)])
+        _add_metric(lines, 'mnp_push_seconds', 'Duration of the push to the SMSSW server', [('', self.push_seconds)])
+        _add_metric(lines, 'mnp_hlr3_batches', 'Batches loaded into HLR3', [('', self.hlr3_batches)])
+        _add_metric(lines, 'mnp_hlr3_handled_lines', 'Lines handled by HLR3', [('', self.hlr3_handled_lines)])
+        _add_metric(lines, 'mnp_hlr3_successfully_lines', 'Lines loaded into HLR3', [
+            ('', self.hlr3_successfully_lines),
+        ])
+        _add_metric(lines, 'mnp_hlr3_load_seconds', 'Duration of the HLR3 load', [('', self.hlr3_load_seconds)])
+
+        countries = sorted(self.countries.items())
+        _add_metric(lines, 'mnp_country_status', 'Status of the country in the last run, 1 for the current status', [
+            (f'country="{name}",status="{metrics.status}"', 1) for name, metrics in countries
+        ])
+        for name, help_text in COUNTRY_METRICS:
+            _add_metric(lines, f'mnp_country_{name}', help_text, [
+                (f'country="{country}"', getattr(metrics, name)) for country, metrics in countries
+            ])
+
+        _add_metric(lines, 'mnp_country_row_errors', 'Rows of the mnp file with an error, by error type', [
+            (f'country="{country}",type="{_escape_label(error_type)}"', count)
+            for country, metrics in countries
+            for error_type, count in sorted(metrics.row_errors.items())
+        ])
+        return '\n'.join(lines) + '\n'
+
+
+COUNTRY_METRICS = (
+    ('download_bytes', 'Size of the downloaded mnp file'),
+    ('download_seconds', 'Duration of the mnp file download'),
+    ('rows_read', 'Non empty rows read from the mnp file'),
+    ('rows_accepted', 'Rows written to the FTP file'),
+    ('rows_dropped', 'Rows skipped by the parser'),
+    ('hlr3_rows_dropped', 'Accepted rows not written to the HLR3 file'),
+    ('parse_seconds', 'Duration of parsing and saving the mnp file'),
+    ('parse_rows_per_second', 'Parse throughput'),
+    ('output_bytes', 'Size of the FTP and HLR3 files'),
+    ('archive_bytes', 'Size of the mnp file archive'),
+    ('archive_seconds', 'Duration of archiving the mnp file'),
+    ('archive_ratio', 'Archive size to mnp file size ratio'),
+)
+
+
+def _add_metric(lines: List[str], name: str, help_text: str, samples: List[Tuple[str, float]]) -> None:
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} gauge')
+    for labels, value in samples:
+        lines.append(f'{name}{{{labels}}} {value}' if labels else f'{name} {value}')
+
+
+def _escape_label(value: str) -> str:
+    return value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _write_atomic(file: str, content: str) -> None:
+    # textfile collectors may read at any time, never expose a partially written file
+    tmp_file = f'{file}.tmp'
+    with open(tmp_file, 'w') as f:
+        f.write(content)
+
+    os.replace(tmp_file, file)
@@ -0,0 +1,272 @@
+"""
+SQLite index of ported numbers: current mccmnc, active_from and ownerID of every dnis and the history of its changes.
+The index of a country is updated in bulk from its hlr3 file on every save, sources are full snapshots,
+so numbers missing from the file are removed. As in delta, only a new mccmnc or ownerID is a change.
+
+    python -m mnp_index lookup 77011234567 37120000001
+    python -m mnp_index lookup --file numbers.txt > result.csv
+    python -m mnp_index history 77011234567
+"""
+import argparse
+import csv
+import hashlib
+import os
+import sqlite3
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+from logger_config import configure_logger
+
+logger = configure_logger(__name__)
+
+# host parameters per query, sqlite allows at least 999
+LOOKUP_BATCH_SIZE = 500
+INSERT_BATCH_SIZE = 100_000
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS numbers (
+    dnis TEXT PRIMARY KEY,
+    mccmnc TEXT NOT NULL,
+    active_from INTEGER NOT NULL,
+    owner_id TEXT,
+    country TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS numbers_country ON numbers (country);
+CREATE TABLE IF NOT EXISTS history (
+    dnis TEXT NOT NULL,
+    mccmnc TEXT NOT NULL,
+    active_from INTEGER NOT NULL,
+    owner_id TEXT,
+    country TEXT NOT NULL,
+    valid_to INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS history_dnis ON history (dnis);
+CREATE TABLE IF NOT EXISTS sources (
+    country TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    indexed_at INTEGER NOT NULL
+);
+'''
+
+
+class NumberRecord(NamedTuple):
+    dnis: str
+    mccmnc: str
+    active_from: int
+    owner_id: Optional[str]
+    country: str
+    # end of validity of a history record, None for the current one
+    valid_to: Optional[int] = None
+
+
+@dataclass
+class IndexResult:
+    added: int = 0
+    changed: int = 0
+    removed: int = 0
+
+
+class MnpIndex:
+
+    def __init__(self, index_file: str, timeout: float = 600, read_only: bool = False):
+        """
+        :param timeout: seconds writers of several worker processes wait for each other
+        :param read_only: open an existing index for lookups, without creating it or touching its schema
+        """
+        if read_only:
+            # sqlite3.OperationalError for a missing file instead of a new empty index
+            uri = f'{Path(index_file).absolute().as_uri()}?mode=ro'
+            self.connection = sqlite3.connect(uri, timeout=timeout, isolation_level=None, uri=True)
+            return
+
+        self.connection = sqlite3.connect(index_file, timeout=timeout, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('PRAGMA temp_store=MEMORY')
+        self.connection.execute('PRAGMA cache_size=-262144')
+        self.connection.executescript(_SCHEMA)
+
+    def __enter__(self) -> 'MnpIndex':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def update_country(self, country: str, hlr3_file: str, timestamp: Optional[int] = None) -> IndexResult:
+        """
+        Replace the numbers of country with the ones of its hlr3 file, changed and removed numbers go to history.
+        A file that was already indexed for the country is skipped
+        :return: number of added, changed and removed numbers
+        """
+        timestamp = timestamp if timestamp is not None else int(time.time())
+        with open(hlr3_file, 'rb') as f:
+            digest = hashlib.file_digest(f, 'sha256').hexdigest()
+
+        indexed = self.connection.execute('SELECT sha256 FROM sources WHERE country = ?', (country,)).fetchone()
+        if indexed is not None and indexed[0] == digest:
+            logger.info(f'mnp index of {country} is up to date')
+            return IndexResult()
+
+        cursor = self.connection.cursor()
+        cursor.execute('CREATE TEMP TABLE IF NOT EXISTS staging (dnis TEXT PRIMARY KEY, mccmnc TEXT, '
+                       'active_from INTEGER, owner_id TEXT) WITHOUT ROWID')
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            with open(hlr3_file, 'r', newline='') as f:
+                rows = _read_hlr3_rows(f)
+                while batch := list(islice(rows, INSERT_BATCH_SIZE)):
+                    # a number repeated in the file keeps its latest record
+                    cursor.executemany(
+                        'INSERT INTO staging VALUES (?, ?, ?, ?) ON CONFLICT (dnis) DO UPDATE SET '
+                        'mccmnc = excluded.mccmnc, active_from = excluded.active_from, owner_id = excluded.owner_id '
+                        'WHERE excluded.active_from >= staging.active_from',
+                        batch,
+                    )
+
+            index_result = IndexResult()
+            index_result.added = cursor.execute(
+                'SELECT count(*) FROM staging s WHERE NOT EXISTS (SELECT 1 FROM numbers n WHERE n.dnis = s.dnis)',
+            ).fetchone()[0]
+            cursor.execute(
+                'INSERT INTO history SELECT n.dnis, n.mccmnc, n.active_from, n.owner_id, n.country, ? '
+                'FROM numbers n JOIN staging s ON s.dnis = n.dnis '
+                'WHERE s.mccmnc != n.mccmnc OR s.owner_id IS NOT n.owner_id',
+                (timestamp,),
+            )
+            index_result.changed = cursor.rowcount
+            cursor.execute(
+                'INSERT INTO history SELECT n.dnis, n.mccmnc, n.active_from, n.owner_id, n.country, ? '
+                'FROM numbers n WHERE n.country = ? AND NOT EXISTS (SELECT 1 FROM staging s WHERE s.dnis = n.dnis)',
+                (timestamp, country),
+            )
+            index_result.removed = cursor.rowcount
+            cursor.execute(
+                'DELETE FROM numbers '
+                'WHERE country = ? AND NOT EXISTS (SELECT 1 FROM staging s WHERE s.dnis = numbers.dnis)',
+                (country,),
+            )
+            # WHERE true: an upsert of a SELECT needs a WHERE clause to parse
+            cursor.execute(
+                'INSERT INTO numbers SELECT dnis, mccmnc, active_from, owner_id, ? FROM staging WHERE true '
+                'ON CONFLICT (dnis) DO UPDATE SET mccmnc = excluded.mccmnc, active_from = excluded.active_from, '
+                'owner_id = excluded.owner_id, country = excluded.country '
+                'WHERE excluded.mccmnc != numbers.mccmnc OR excluded.owner_id IS NOT numbers.owner_id',
+                (country,),
+            )
+            cursor.execute(
+                'INSERT OR REPLACE INTO sources VALUES (?, ?, ?)',
+                (country, digest, timestamp),
+            )
+            cursor.execute('COMMIT')
+        except BaseException:
+            cursor.execute('ROLLBACK')
+            raise
+        finally:
+            cursor.execute('DELETE FROM staging')
+
+        logger.info(f'mnp index of {country} updated: {index_result}')
+        return index_result
+
+    def lookup(self, dnis: str) -> Optional[NumberRecord]:
+        row = self.connection.execute(
+            'SELECT dnis, mccmnc, active_from, owner_id, country FROM numbers WHERE dnis = ?', (dnis,),
+        ).fetchone()
+        return NumberRecord(*row) if row else None
+
+    def lookup_many(self, numbers: Iterable[str]) -> Dict[str, NumberRecord]:
+        """
+        :return: current record of every found number
+        """
+        records = {}
+        numbers = iter(numbers)
+        while batch := list(islice(numbers, LOOKUP_BATCH_SIZE)):
+            query = (
+                'SELECT dnis, mccmnc, active_from, owner_id, country FROM numbers '
+                f'WHERE dnis IN ({",".join("?" * len(batch))})'
+            )
+            for row in self.connection.execute(query, batch):
+                records[row[0]] = NumberRecord(*row)
+
+        return records
+
+    def history(self, dnis: str) -> List[NumberRecord]:
+        """
+        :return: previous records of the number, oldest first, followed by the current one
+        """
+        records = [
+            NumberRecord(*row) for row in self.connection.execute(
+                'SELECT dnis, mccmnc, active_from, owner_id, country, valid_to FROM history '
+                'WHERE dnis = ? ORDER BY valid_to, rowid',
+                (dnis,),
+            )
+        ]
+        current = self.lookup(dnis)
+        if current is not None:
+            records.append(current)
+
+        return records
+
+
+def _read_hlr3_rows(f) -> Iterator[tuple]:
+    # dnis;mccmnc;active_from;ownerID;providerResponseCode
+    for row in csv.reader(f, delimiter=';'):
+        if row:
+            yield row[0], row[1], int(row[2]), row[3] or None
+
+
+def _read_numbers(numbers: List[str], numbers_file: Optional[str]) -> Iterator[str]:
+    yield from numbers
+    if numbers_file:
+        with sys.stdin if numbers_file == '-' else open(numbers_file, 'r') as f:
+            for line in f:
+                if line := line.strip():
+                    yield line
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description='Look up ported numbers in the mnp index')
+    # defaults come straight from the environment (with .env), a lookup does not need the variables of a full run
+    arg_parser.add_argument(
+        '--index',
+        default=os.environ.get('MNP_INDEX_FILE', ''),
+        help='index file (default MNP_INDEX_FILE)',
+    )
+    commands = arg_parser.add_subparsers(dest='command', required=True)
+    lookup_parser = commands.add_parser(
+        'lookup',
+        help='current record of numbers, as dnis;mccmnc;active_from;ownerID;country',
+    )
+    lookup_parser.add_argument('numbers', nargs='*')
+    lookup_parser.add_argument('--file', help='file with a number per line, - for stdin')
+    history_parser = commands.add_parser('history', help='all records of a number, with the end of their validity')
+    history_parser.add_argument('dnis')
+    args = arg_parser.parse_args()
+    if not args.index:
+        arg_parser.error('no index file, set MNP_INDEX_FILE or --index')
+
+    if not os.path.isfile(args.index):
+        arg_parser.error(f'index file {args.index} does not exist')
+
+    writer = csv.writer(sys.stdout, delimiter=';', lineterminator='\n')
+    with MnpIndex(args.index, read_only=True) as index:
+        if args.command == 'lookup':
+            numbers = _read_numbers(args.numbers, args.file)
+            while batch := list(islice(numbers, LOOKUP_BATCH_SIZE * 20)):
+                records = index.lookup_many(batch)
+                for dnis in batch:
+                    record = records.get(dnis)
+                    writer.writerow(record[:5] if record else (dnis, '', '', '', ''))
+        else:
+            for record in index.history(args.dnis):
+                writer.writerow(record)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+import locale
+import os
+from typing import Iterator, List, Optional, Tuple
+
+
+def split_file(in_file: str, chunk_size: int) -> List[Tuple[int, int]]:
+    """
+    Split a file into byte ranges of about chunk_size, every range starts at the beginning of a line
+    :return: list of (start, end) offsets covering the whole file
+    """
+    size = os.path.getsize(in_file)
+    offsets = [0]
+    with open(in_file, 'rb') as f:
+        while offsets[-1] + chunk_size < size:
+            f.seek(offsets[-1] + chunk_size)
+            f.readline()
+            position = f.tell()
+            if position >= size:
+                break
+
+            offsets.append(position)
+
+    offsets.append(size)
+    return list(zip(offsets, offsets[1:]))
+
+
+def read_lines(in_file: str, start: int, end: int, encoding: Optional[str] = None) -> Iterator[str]:
+    """
+    Read decoded lines of a file that start in [start, end)
+    """
+    # same encoding the parsers use when they open the whole file in text mode
+    encoding = encoding or locale.getpreferredencoding(False)
+    with open(in_file, 'rb') as f:
+        f.seek(start)
+        position = start
+        while position < end:
+            line = f.readline()
+            if not line:
+                break
+
+            position += len(line)
+            yield line.decode(encoding)
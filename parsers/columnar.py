@@ -0,0 +1,175 @@
+"""
+Columnar backend of the CSV based parsers: a block of rows is turned into column arrays,
+filtering, mccmnc mapping, number prefixing and date conversion run as numpy operations
+and the output lines of the block are built in bulk. The output is byte identical to the
+row based parsers, blocks that would need csv quoting are formatted by the csv module.
+numpy is only needed when this backend is used
+"""
+import csv
+import io
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Sequence, Union
+
+import numpy as np
+
+from parsers.parser import FTP_CSV_FORMAT, HLR3_CSV_FORMAT, MnpRecord
+from parsers.timestamps import TimestampConverter
+
+# characters that make the csv module quote a field
+_QUOTED_CHARS = (';', '"', '\r', '\n')
+
+
+class ColumnBlock(NamedTuple):
+    ftp_text: str
+    hlr3_text: str
+    hlr_records: int
+    hlr3_records: int
+
+
+def read_blocks(rows: Iterable[List[str]], block_rows: int) -> Iterator[List[List[str]]]:
+    rows = iter(rows)
+    while block := list(islice(rows, block_rows)):
+        yield block
+
+
+def kazakhstan_block(
+        rows: Sequence[List[str]],
+        port_date_to_timestamp: Union[TimestampConverter, Callable[[str], int]],
+) -> ColumnBlock:
+    # Number, OwnerId, MNC, Route, PortDate, RowCount
+    rows = [row[:5] for row in rows if row]
+    if not rows:
+        return ColumnBlock('', '', 0, 0)
+
+    # one 2-d array in a single call, columns are views of it
+    table = np.array(rows)
+    dnis = table[:, 0]
+    route = table[:, 3]
+    mccmnc = np.char.add('4010', table[:, 2])
+    active_from = _to_timestamps(table[:, 4], port_date_to_timestamp)
+
+    if _needs_quoting(dnis.tolist(), table[:, 2].tolist(), route.tolist()):
+        return _format_records([
+            MnpRecord(dnis=str(number), mccmnc=str(code), active_from=int(timestamp), owner_id=str(owner))
+            for number, code, timestamp, owner in zip(dnis, mccmnc, active_from, route)
+        ])
+
+    empty = np.full(len(dnis), '')
+    ftp_lines = _join_columns(dnis, mccmnc)
+    hlr3_lines = _join_columns(dnis, mccmnc, active_from, route, empty)
+    return ColumnBlock(
+        ftp_text=_join_lines(ftp_lines, FTP_CSV_FORMAT['lineterminator']),
+        hlr3_text=_join_lines(hlr3_lines, HLR3_CSV_FORMAT['lineterminator']),
+        hlr_records=len(dnis),
+        hlr3_records=len(dnis),
+    )
+
+
+def latvia_block(rows: Sequence[List[str]], rn2mcc: Dict[str, str], run_timestamp: int) -> ColumnBlock:
+    # dnis, rn
+    rows = [row for row in rows if len(row) > 1]
+    if not rows:
+        return ColumnBlock('', '', 0, 0)
+
+    columns = list(zip(*rows))
+    rn = np.array(columns[1])
+    accepted = np.isin(rn, list(rn2mcc))
+    numbers = np.array(columns[0])[accepted]
+    if not len(numbers):
+        return ColumnBlock('', '', 0, 0)
+
+    dnis = np.char.add('371', numbers)
+    mccmnc = _map_unique(rn[accepted], rn2mcc.__getitem__)
+    active_from = str(run_timestamp)
+
+    if _needs_quoting(numbers.tolist()):
+        return _format_records([
+            MnpRecord(dnis=str(row_dnis), mccmnc=str(row_mccmnc), active_from=run_timestamp)
+            for row_dnis, row_mccmnc in zip(dnis, mccmnc)
+        ])
+
+    empty = np.full(len(dnis), '')
+    ftp_lines = _join_columns(dnis, mccmnc)
+    hlr3_lines = _join_columns(dnis, mccmnc, np.full(len(dnis), active_from), empty, empty)
+    return ColumnBlock(
+        ftp_text=_join_lines(ftp_lines, FTP_CSV_FORMAT['lineterminator']),
+        hlr3_text=_join_lines(hlr3_lines, HLR3_CSV_FORMAT['lineterminator']),
+        hlr_records=len(dnis),
+        hlr3_records=len(dnis),
+    )
+
+
+def _map_unique(values: np.ndarray, convert: Callable[[str], str]) -> np.ndarray:
+    # values repeat a lot (dates, operators): convert every distinct value once
+    unique, inverse = np.unique(values, return_inverse=True)
+    converted = np.array([convert(str(value)) for value in unique])
+    return converted[inverse]
+
+
+def _to_timestamps(values: np.ndarray, convert: Union[TimestampConverter, Callable[[str], int]]) -> np.ndarray:
+    """
+    Timestamps (as strings) of date time values. With a TimestampConverter only the distinct days are converted
+    in Python, the time of day is read from the characters of the values as numbers.
+    Values that do not match its format and days with a DST change go through the converter one by one
+    """
+    if not isinstance(convert, TimestampConverter) or not len(values):
+        return _map_unique(values, lambda value: str(convert(value)))
+
+    length = convert.length
+    matching = np.char.str_len(values) == length
+    # one row of code points per value, shorter values are padded with zeros and longer ones do not match
+    chars = values.astype(f'<U{length}').view(np.uint32).reshape(len(values), length)
+    for position, char in convert.literal_positions:
+        matching &= chars[:, position] == ord(char)
+
+    fields = {}
+    for name, field in (('year', convert.year_field), ('month', convert.month_field), ('day', convert.day_field),
+                        ('hour', convert.hour), ('minute', convert.minute), ('second', convert.second)):
+        digits = chars[:, field].astype(np.int64) - ord('0')
+        matching &= ((digits >= 0) & (digits <= 9)).all(axis=1)
+        fields[name] = digits @ 10 ** np.arange(digits.shape[1] - 1, -1, -1)
+
+    matching &= (fields['hour'] < 24) & (fields['minute'] < 60) & (fields['second'] < 60)
+    seconds = fields['hour'] * 3600 + fields['minute'] * 60 + fields['second']
+    # distinct days by number, the converter gets the date portion of their first value
+    matched = np.flatnonzero(matching)
+    days = (fields['year'] * 10000 + fields['month'] * 100 + fields['day'])[matched]
+    _, first, inverse = np.unique(days, return_index=True, return_inverse=True)
+    day_starts = [convert.day_start(str(values[matched[index]])[convert.date]) for index in first]
+    known_days = np.array([day_start is not None for day_start in day_starts], dtype=bool)[inverse]
+    matched, inverse = matched[known_days], inverse[known_days]
+
+    timestamps = np.empty(len(values), dtype=np.int64)
+    timestamps[matched] = np.array([day_start or 0 for day_start in day_starts], dtype=np.int64)[inverse]
+    timestamps[matched] += seconds[matched]
+    unmatched = np.ones(len(values), dtype=bool)
+    unmatched[matched] = False
+    for index in np.flatnonzero(unmatched):
+        timestamps[index] = convert(str(values[index]))
+
+    return timestamps.astype(str)
+
+
+def _join_columns(*columns: np.ndarray) -> np.ndarray:
+    line = columns[0]
+    for column in columns[1:]:
+        line = np.char.add(np.char.add(line, ';'), column)
+
+    return line
+
+
+def _join_lines(lines: np.ndarray, lineterminator: str) -> str:
+    return lineterminator.join(lines.tolist()) + lineterminator
+
+
+def _needs_quoting(*columns: Sequence[str]) -> bool:
+    text = ''.join(''.join(column) for column in columns)
+    return any(char in text for char in _QUOTED_CHARS)
+
+
+def _format_records(records: List[MnpRecord]) -> ColumnBlock:
+    ftp_f = io.StringIO()
+    hlr3_f = io.StringIO()
+    csv.writer(ftp_f, **FTP_CSV_FORMAT).writerows(record.hlr_row() for record in records)
+    csv.writer(hlr3_f, **HLR3_CSV_FORMAT).writerows(record.hlr3_row() for record in records)
+    return ColumnBlock(ftp_f.getvalue(), hlr3_f.getvalue(), len(records), len(records))
@@ -1,12 +1,33 @@
 import csv
-import openpyxl
+import sys
+import time
+import contextlib
 import datetime
-from typing import Protocol, List, Dict
+from typing import (
+    TYPE_CHECKING,
+    ContextManager,
+    Dict,
+    Iterable,
+    Iterator,
+    NamedTuple,
+    Optional,
+    Protocol,
+    TextIO,
+    Tuple,
+    Union,
+)
 from enum import Enum, auto
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 from logger_config import configure_logger
+from parsers.chunks import read_lines
 from parsers.georgia_mapping import GEORGIA_OPERATOR_MAPPING
+from parsers.row_errors import RowErrors
+from parsers.timestamps import TimestampConverter
+
+# parsers.columnar needs numpy, an optional dependency: parse_columns methods import it when they are called
+if TYPE_CHECKING:
+    from parsers.columnar import ColumnBlock
 
 logger = configure_logger(__name__)
 
@@ -18,172 +39,284 @@ class AvailableCountry(Enum):
     Belarus = auto()
 
 
+# path of a raw mnp file or an already opened text stream of it
+MnpSource = Union[str, TextIO]
+
+# csv.writer arguments of the output files, the HLR3 files are joined byte for byte
+# into the full hlr file, which has always had unix line endings
+FTP_CSV_FORMAT = {'delimiter': ';', 'lineterminator': '\r\n'}
+HLR3_CSV_FORMAT = {'delimiter': ';', 'lineterminator': '\n'}
+
+
+class MnpRecord(NamedTuple):
+    """
+    Single parsed mnp record, both FTP and HLR3 rows are projected from it at write time.
+    active_from is None when the record is only good enough for the FTP file
+    """
+    dnis: str
+    mccmnc: str
+    active_from: Optional[int] = None
+    owner_id: Optional[str] = None
+
+    def hlr_row(self) -> Tuple[str, str]:
+        return self.dnis, self.mccmnc
+
+    def hlr3_row(self) -> Tuple[str, str, int, Optional[str], None]:
+        # dnis, mccmnc, active_from, ownerID, providerResponseCode
+        return self.dnis, self.mccmnc, self.active_from, self.owner_id, None
+
+
 @dataclass
 class ParseResult:
-    hlr3_records: List[Dict[str, str]]
-    hlr_records: List[Dict[str, str]]
+    hlr3_records: int = 0
+    hlr_records: int = 0
+    # non empty data rows of the source, set from the parser once its records are consumed
+    rows_read: int = 0
+    # size of the committed FTP and HLR3 files
+    output_bytes: int = 0
+    # error type -> number of rows of the source with the error
+    row_errors: Dict[str, int] = field(default_factory=dict)
 
 
 class MnpParser(Protocol):
+    rows_read: int
+    row_errors: RowErrors
+
+    def parse(self, in_file: MnpSource) -> Iterator[MnpRecord]:
+        pass
 
-    def parse(self, in_file: str) -> ParseResult:
+
+class ColumnarMnpParser(MnpParser, Protocol):
+    """
+    Parser with the numpy backend (see parsers.columnar), output comes as preformatted blocks of rows
+    """
+
+    def parse_columns(self, in_file: MnpSource, block_rows: int) -> Iterator['ColumnBlock']:
+        pass
+
+
+class ChunkedMnpParser(MnpParser, Protocol):
+    """
+    Parser of a line based format that can parse a byte range of the file on its own,
+    chunks start on line boundaries (see parsers.chunks.split_file)
+    """
+
+    def parse_chunk(self, in_file: str, start: int, end: int) -> Iterator[MnpRecord]:
         pass
 
 
+def open_text(in_file: MnpSource) -> ContextManager[TextIO]:
+    """
+    Open a path for reading, a stream is used as is and left to its owner to close
+    """
+    if isinstance(in_file, str):
+        return open(in_file, 'r')
+
+    return contextlib.nullcontext(in_file)
+
+
 class GeorgiaMnpParser:
+    port_date_to_timestamp = TimestampConverter('%Y-%m-%d %H:%M:%S')
+
+    def __init__(self):
+        self.rows_read = 0
+        self.row_errors = RowErrors('Georgia')
 
-    def parse(self, in_file: str) -> ParseResult:
+    def parse(self, in_file: MnpSource) -> Iterator[MnpRecord]:
         logger.info('starting parsing Georgia mnp file')
-        parse_result = ParseResult(hlr3_records=[], hlr_records=[])
-        with open(in_file) as f:
+        with open_text(in_file) as f:
             csv_reader = csv.reader(f, delimiter=';')
             next(csv_reader)
             for row in csv_reader:
+                if not row:
+                    continue
+
+                self.rows_read += 1
                 # record type is MNP(10) and number type is Mobile(2)
                 if row[0] == '10' and row[2] == '2':
                     try:
                         mccmnc = GEORGIA_OPERATOR_MAPPING[int(row[5])]
                     except KeyError:
-                        logger.warning(f'cant get mccmnc from record {row}')
-
-                    parse_result.hlr3_records.append(
-                        {
-                            'dnis': row[3],
-                            'mccmnc': mccmnc,
-                            'active_from': int(datetime.datetime.strptime(row[9], '%Y-%m-%d %H:%M:%S').timestamp()),
-                            'ownerID': None,
-                            'providerResponseCode': None,
-                        },
-                    )
-                    parse_result.hlr_records.append(
-                        {
-                            'dnis': row[3],
-                            'mccmnc': mccmnc,
-                        },
+                        self.row_errors.add('unknown operator', row)
+                        continue
+
+                    yield MnpRecord(
+                        dnis=row[3],
+                        mccmnc=mccmnc,
+                        active_from=self.port_date_to_timestamp(row[9]),
                     )
 
-            return parse_result
+        self.row_errors.log_summary(logger)
 
 
 class LatviaMnpParser:
-
-    def parse(self, in_file: str) -> ParseResult:
+    rn2mcc: dict = {
+        'BC20': '247002',
+        'BC21': '247002',
+        'BC40': '247005',
+        'BC10': '247001',
+        'BC30': '247003',
+    }
+    # operator2mcc: dict = {
+    #     'Tele2': '247002',
+    #     'BITE Latvija': '247005',
+    #     'Latvijas Mobilais Telefons': '247001',
+    #     'Telekom Baltija': '247003',
+    # }
+
+    def __init__(self, run_timestamp: Optional[int] = None):
+        # the file has no dates, every record is active from the start of the run
+        self.run_timestamp = run_timestamp if run_timestamp is not None else int(time.time())
+        self.rows_read = 0
+        self.row_errors = RowErrors('Latvia')
+
+    def parse(self, in_file: MnpSource) -> Iterator[MnpRecord]:
         logger.info('Starting parsing Latvia mnp file')
-        parse_result = ParseResult(hlr3_records=[], hlr_records=[])
-
-        rn2mcc: dict = {
-            'BC20': '247002',
-            'BC21': '247002',
-            'BC40': '247005',
-            'BC10': '247001',
-            'BC30': '247003',
-        }
-        # operator2mcc: dict = {
-        #     'Tele2': '247002',
-        #     'BITE Latvija': '247005',
-        #     'Latvijas Mobilais Telefons': '247001',
-        #     'Telekom Baltija': '247003',
-        # }
-
-        with open(in_file, 'r') as f:
-            reader = csv.DictReader(f, delimiter=' ', fieldnames=('dnis', 'mccmnc'))
-            for row in reader:
-                if row['mccmnc'] in rn2mcc.keys():
-                    parse_result.hlr3_records.append(
-                        {
-                            'dnis': f'371{row["dnis"]}',
-                            'mccmnc': rn2mcc[row['mccmnc']],
-                            'active_from': int(datetime.datetime.now().timestamp()),
-                            'ownerID': None,
-                            'providerResponseCode': None,
-                        },
-                    )
-                    parse_result.hlr_records.append(
-                        {
-                            'dnis': f'371{row["dnis"]}',
-                            'mccmnc': rn2mcc[row['mccmnc']],
-                        },
-                    )
-                else:
-                    pass
-
-        return parse_result
+        with open_text(in_file) as f:
+            yield from self._parse_lines(f)
+
+    def parse_chunk(self, in_file: str, start: int, end: int) -> Iterator[MnpRecord]:
+        yield from self._parse_lines(read_lines(in_file, start, end))
+
+    def parse_columns(self, in_file: MnpSource, block_rows: int) -> Iterator['ColumnBlock']:
+        from parsers.columnar import latvia_block, read_blocks
+
+        logger.info('Starting columnar parsing Latvia mnp file')
+        with open_text(in_file) as f:
+            for rows in read_blocks(csv.reader(f, delimiter=' '), block_rows):
+                self.rows_read += sum(1 for row in rows if row)
+                yield latvia_block(rows, self.rn2mcc, self.run_timestamp)
+
+    def _parse_lines(self, lines: Iterable[str]) -> Iterator[MnpRecord]:
+        # dnis, rn
+        reader = csv.reader(lines, delimiter=' ')
+        for row in reader:
+            if not row:
+                continue
+
+            self.rows_read += 1
+            if len(row) > 1 and row[1] in self.rn2mcc:
+                yield MnpRecord(
+                    dnis=f'371{row[0]}',
+                    mccmnc=self.rn2mcc[row[1]],
+                    active_from=self.run_timestamp,
+                )
 
 
 class BelarusMnpParser:
+    sheet_name = 'Sheet1'
+    csv_delimiter = ';'
+    port_date_to_timestamp = TimestampConverter('%d.%m.%Y %H:%M:%S')
 
-    def parse(self, in_file: str) -> ParseResult:
+    def __init__(self):
+        self.rows_read = 0
+        self.row_errors = RowErrors('Belarus')
+
+    def parse(self, in_file: str) -> Iterator[MnpRecord]:
+        # only a path: the format is picked by the file extension
         logger.info('starting parsing Belarus mnp file')
-        parse_result = ParseResult(hlr3_records=[], hlr_records=[])
-        work_book = openpyxl.load_workbook(in_file)
-        sheet = work_book['Sheet1']
-
-        for row in sheet.iter_rows(1, sheet.max_row):
-            mnc_cell, msisdn_cell, port_date_cell = row
-            parse_result.hlr_records.append(
-                {
-                    'dnis': msisdn_cell.value,
-                    'mccmnc': f'2570{mnc_cell.value}',
-                },
-            )
+        if in_file.lower().endswith('.csv'):
+            rows = self._read_csv(in_file)
+        else:
+            rows = self._read_xlsx(in_file)
+
+        for row in rows:
+            # blank sheet rows come as tuples of None
+            if all(value in (None, '') for value in row):
+                continue
+
+            self.rows_read += 1
+            if len(row) < 3 or not row[1]:
+                self.row_errors.add('short row', row)
+                continue
+
+            mnc, msisdn, port_date = row[:3]
             try:
-                parse_result.hlr3_records.append(
-                    {
-                        'dnis': msisdn_cell.value,
-                        'mccmnc': f'2570{mnc_cell.value}',
-                        'active_from': int(
-                            datetime.datetime.strptime(port_date_cell.value, '%d.%m.%Y %H:%M:%S').timestamp(),
-                        ),
-                        'ownerID': None,
-                        'providerResponseCode': None,
-                    },
-                )
-            except:
-                logger.exception(
-                    f'An error occurred while parsing record {mnc_cell.value, msisdn_cell.value, port_date_cell.value}',
-                    exc_info=True,
-                )
+                active_from = self.port_date_to_timestamp(port_date)
+            except Exception as e:
+                # the record is kept without a port date
+                self.row_errors.add(f'bad port date ({type(e).__name__})', (mnc, msisdn, port_date))
+                active_from = None
+
+            yield MnpRecord(
+                dnis=msisdn,
+                mccmnc=sys.intern(f'2570{mnc}'),
+                active_from=active_from,
+            )
 
-        return parse_result
+        self.row_errors.log_summary(logger)
 
+    def _read_xlsx(self, in_file: str) -> Iterator[tuple]:
+        # openpyxl is slow to import, only xlsx sources need it
+        import openpyxl
 
-class KazakhstanMnpParser:
+        # read-only mode streams the sheet xml instead of building the whole workbook in memory,
+        # it still parses about 10k rows/s, ten times slower than the CSV export: prefer CSV for big feeds
+        work_book = openpyxl.load_workbook(in_file, read_only=True, data_only=True)
+        try:
+            yield from work_book[self.sheet_name].iter_rows(values_only=True)
+        finally:
+            work_book.close()
+
+    def _read_csv(self, in_file: str) -> Iterator[list]:
+        # CSV export of the same sheet: mnc, msisdn, port date
+        with open(in_file, 'r', newline='') as f:
+            for row in csv.reader(f, delimiter=self.csv_delimiter):
+                if row:
+                    yield row
 
-    def parse(self, in_file: str) -> ParseResult:
-        hlr3_records = []
-        hlr_records = []
-        parse_result = ParseResult(hlr3_records=hlr3_records, hlr_records=hlr_records)
 
-        with open(in_file, 'r') as f:
-            csv_reader = csv.DictReader(
-                f,
-                delimiter=',',
-                fieldnames=('Number', 'OwnerId', 'MNC', 'Route', 'PortDate', 'RowCount'),
+class KazakhstanMnpParser:
+    port_date_to_timestamp = TimestampConverter('%Y-%m-%d %H:%M:%S', fallback=datetime.datetime.fromisoformat)
+
+    def __init__(self):
+        self.rows_read = 0
+        self.row_errors = RowErrors('Kazakhstan')
+
+    def parse(self, in_file: MnpSource) -> Iterator[MnpRecord]:
+        with open_text(in_file) as f:
+            yield from self._parse_lines(f, skip_header=True)
+
+    def parse_chunk(self, in_file: str, start: int, end: int) -> Iterator[MnpRecord]:
+        yield from self._parse_lines(read_lines(in_file, start, end), skip_header=start == 0)
+
+    def parse_columns(self, in_file: MnpSource, block_rows: int) -> Iterator['ColumnBlock']:
+        from parsers.columnar import kazakhstan_block, read_blocks
+
+        with open_text(in_file) as f:
+            csv_reader = csv.reader(f, delimiter=',')
+            next(csv_reader, None)
+            for rows in read_blocks(csv_reader, block_rows):
+                self.rows_read += sum(1 for row in rows if row)
+                yield kazakhstan_block(rows, self.port_date_to_timestamp)
+
+    def _parse_lines(self, lines: Iterable[str], skip_header: bool) -> Iterator[MnpRecord]:
+        # Number, OwnerId, MNC, Route, PortDate, RowCount
+        csv_reader = csv.reader(lines, delimiter=',')
+        if skip_header:
+            next(csv_reader, None)
+
+        for row in csv_reader:
+            if not row:
+                continue
+
+            self.rows_read += 1
+            yield MnpRecord(
+                dnis=row[0],
+                mccmnc=sys.intern(f'4010{row[2]}'),
+                active_from=self.port_date_to_timestamp(row[4]),
+                owner_id=row[3],
             )
-            next(csv_reader)
-            for row in csv_reader:
-                hlr_records = {
-                    'dnis': row['Number'],
-                    'mccmnc': f"4010{row['MNC']}",
-                }
-                hlr3_records = {
-                    'dnis': row['Number'],
-                    'mccmnc': f"4010{row['MNC']}",
-                    'active_from': int(datetime.datetime.fromisoformat(row['PortDate']).timestamp()),
-                    'ownerID': row['Route'],
-                    'providerResponseCode': None,
-                }
-                parse_result.hlr_records.append(hlr_records)
-                parse_result.hlr3_records.append(hlr3_records)
-
-        return parse_result
-
-
-def get_parser(country: AvailableCountry) -> MnpParser:
+
+
+def get_parser(country: AvailableCountry, run_timestamp: Optional[int] = None) -> MnpParser:
+    """
+    :param run_timestamp: active_from for sources without dates, shared by all workers of a run
+    """
     try:
         match country:
             case country.Latvia:
-                return LatviaMnpParser()
+                return LatviaMnpParser(run_timestamp)
             case country.Belarus:
                 return BelarusMnpParser()
             case country.Kazakhstan:
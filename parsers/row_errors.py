@@ -0,0 +1,31 @@
+import logging
+from typing import Dict, List
+
+
+class RowErrors:
+    """
+    Problems of single rows of a source, counted per error type with the first max_samples rows of each type,
+    so a malformed feed logs a summary instead of a line per row
+    """
+
+    def __init__(self, source: str, max_samples: int = 5):
+        self.source = source
+        self.max_samples = max_samples
+        self.counts: Dict[str, int] = {}
+        self.samples: Dict[str, List[str]] = {}
+
+    def __bool__(self) -> bool:
+        return bool(self.counts)
+
+    def add(self, error_type: str, row) -> None:
+        count = self.counts.get(error_type, 0)
+        self.counts[error_type] = count + 1
+        if count < self.max_samples:
+            self.samples.setdefault(error_type, []).append(repr(row))
+
+    def log_summary(self, logger: logging.Logger) -> None:
+        for error_type, count in self.counts.items():
+            logger.warning(
+                f'{self.source}: {count} rows skipped or incomplete, {error_type}, '
+                f'samples: {"; ".join(self.samples[error_type])}',
+            )
@@ -0,0 +1,110 @@
+import datetime
+import functools
+import operator
+from typing import Callable, Dict, Optional, Tuple
+
+# fixed width fields a TimestampConverter understands
+_FIELD_WIDTHS = {'%Y': 4, '%m': 2, '%d': 2, '%H': 2, '%M': 2, '%S': 2}
+
+
+class TimestampConverter:
+    """
+    Converts local date time strings of a fixed width format to unix timestamps, same result as
+    int(datetime.strptime(value, fmt).timestamp()) without parsing a datetime for every row:
+    the timestamp of the start of the day is memoized by the date portion of the string.
+    Values that do not match the format, and days with a DST change, go to the fallback parser
+    """
+
+    def __init__(
+            self,
+            fmt: str,
+            fallback: Optional[Callable[[str], datetime.datetime]] = None,
+            cache_size: int = 4096,
+    ):
+        self.fmt = fmt
+        self.fallback = fallback or functools.partial(_strptime, fmt=fmt)
+        fields, literals, self.length = _parse_format(fmt)
+        # (position, char) of the separators, for converters of whole columns (see parsers.columnar)
+        self.literal_positions = literals
+        # separators of a value, picked and compared in one go
+        positions, chars = zip(*literals) if literals else ((), ())
+        self.get_literals = operator.itemgetter(*positions) if positions else _no_literals
+        self.literals = chars if len(chars) != 1 else chars[0]
+        self.hour, self.minute, self.second = fields['%H'], fields['%M'], fields['%S']
+        self.year_field, self.month_field, self.day_field = fields['%Y'], fields['%m'], fields['%d']
+        date_start = min(fields[field].start for field in ('%Y', '%m', '%d'))
+        date_end = max(fields[field].stop for field in ('%Y', '%m', '%d'))
+        self.date = slice(date_start, date_end)
+        self.year, self.month, self.day = (
+            slice(fields[field].start - date_start, fields[field].stop - date_start) for field in ('%Y', '%m', '%d')
+        )
+        # timestamp of the start of the day of a date portion (value[self.date]), None for invalid or DST days
+        self.day_start = functools.lru_cache(maxsize=cache_size)(self._get_day_start)
+
+    def __call__(self, value: str) -> int:
+        if len(value) == self.length and self.get_literals(value) == self.literals:
+            hour, minute, second = value[self.hour], value[self.minute], value[self.second]
+            if hour.isdigit() and minute.isdigit() and second.isdigit():
+                hour, minute, second = int(hour), int(minute), int(second)
+                day_start = self.day_start(value[self.date])
+                if day_start is not None and hour < 24 and minute < 60 and second < 60:
+                    return day_start + hour * 3600 + minute * 60 + second
+
+        return int(self.fallback(value).timestamp())
+
+    def _get_day_start(self, date: str) -> Optional[int]:
+        # None when the date is invalid or the day is not 24 hours long in the local timezone
+        year, month, day = date[self.year], date[self.month], date[self.day]
+        if not (year.isdigit() and month.isdigit() and day.isdigit()):
+            return None
+
+        try:
+            day_start = datetime.datetime(int(year), int(month), int(day))
+            next_day_start = day_start + datetime.timedelta(days=1)
+            day_start_timestamp = day_start.timestamp()
+            next_day_start_timestamp = next_day_start.timestamp()
+        except (ValueError, OverflowError):
+            return None
+
+        if next_day_start_timestamp - day_start_timestamp != 86400:
+            return None
+
+        return int(day_start_timestamp)
+
+
+def _no_literals(value: str) -> tuple:
+    return ()
+
+
+def _strptime(value: str, fmt: str) -> datetime.datetime:
+    return datetime.datetime.strptime(value, fmt)
+
+
+def _parse_format(fmt: str) -> Tuple[Dict[str, slice], Tuple[Tuple[int, str], ...], int]:
+    """
+    :return: slices of the fields in a formatted value, (position, char) of the literals, length of a value
+    """
+    fields = {}
+    literals = []
+    position = 0
+    index = 0
+    while index < len(fmt):
+        directive = fmt[index:index + 2]
+        if directive in _FIELD_WIDTHS:
+            fields[directive] = slice(position, position + _FIELD_WIDTHS[directive])
+            position += _FIELD_WIDTHS[directive]
+            index += 2
+            continue
+
+        if fmt[index] == '%':
+            raise ValueError(f'unsupported directive {directive} in {fmt}')
+
+        literals.append((position, fmt[index]))
+        position += 1
+        index += 1
+
+    missing = set(_FIELD_WIDTHS) - set(fields)
+    if missing:
+        raise ValueError(f'{fmt} misses {sorted(missing)}')
+
+    return fields, tuple(literals), position
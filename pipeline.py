@@ -0,0 +1,209 @@
+import asyncio
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+
+from config import settings
+from error.errors import FileNotChangedError, GetFileError
+from file_handlers.file_handler import FileHandler, RawMnpFile, get_file_handler, get_local_file, open_source
+from logger_config import configure_logger
+from metrics import STATUS_EMPTY, STATUS_FAILED, STATUS_NOT_CHANGED, STATUS_OK, CountryMetrics, RunMetrics
+from parsers.parser import AvailableCountry, MnpParser, ParseResult, get_parser
+from profiler import profile_stage, profiled
+from utils import archive_file, save_parse_result, save_parse_result_chunked, save_parse_result_columnar
+
+logger = configure_logger(__name__)
+
+
+@dataclass
+class CountryJob:
+    country: AvailableCountry
+    file_handler: FileHandler
+    raw_mnp_file: Optional[RawMnpFile] = None
+    metrics: CountryMetrics = field(default_factory=CountryMetrics)
+
+
+def parse_country(
+        country: AvailableCountry,
+        raw_mnp_file: RawMnpFile,
+        run_timestamp: Optional[int] = None,
+) -> ParseResult:
+    # runs in a worker process, only picklable arguments and result
+    parser = get_parser(country, run_timestamp)
+    with profile_stage(f'{country.name}.parse'), open_source(raw_mnp_file) as source:
+        if use_columnar_parse(country, parser):
+            blocks = parser.parse_columns(source, settings.columnar_block_rows)
+            parse_result = save_parse_result_columnar(blocks, country)
+        else:
+            parse_result = save_parse_result(parser.parse(source), country)
+
+    parse_result.rows_read = parser.rows_read
+    parse_result.row_errors = parser.row_errors.counts
+    return parse_result
+
+
+def use_columnar_parse(country: AvailableCountry, parser: MnpParser) -> bool:
+    columnar_countries = {name.strip() for name in settings.columnar_countries.split(',')}
+    return country.name in columnar_countries and hasattr(parser, 'parse_columns')
+
+
+def use_chunked_parse(country: AvailableCountry, raw_mnp_file: RawMnpFile) -> bool:
+    if use_columnar_parse(country, get_parser(country)):
+        return False
+
+    if not settings.parse_chunk_size or not hasattr(get_parser(country), 'parse_chunk'):
+        return False
+
+    if not isinstance(raw_mnp_file, str):
+        return False
+
+    return os.path.getsize(raw_mnp_file) > settings.parse_chunk_size
+
+
+class Pipeline:
+    """
+    Download -> parse and save -> archive stages running concurrently for all countries.
+    Stages are connected by bounded queues, at most max_pending_files downloaded files
+    wait in TMP_DIRECTORY at a time: a download only starts when a previous file was archived and removed.
+    A failing country is logged and dropped, the others go on.
+    Per country stage metrics are recorded into run_metrics
+    """
+
+    def __init__(self, max_workers: int, max_pending_files: int, run_metrics: Optional[RunMetrics] = None):
+        self.max_workers = max_workers
+        self.max_pending_files = max_pending_files
+        self.run_metrics = run_metrics if run_metrics is not None else RunMetrics()
+        # "now" of sources without dates, the same for every country and worker of the run
+        self.run_timestamp = int(time.time())
+
+    async def run(self, countries: Iterable[AvailableCountry]) -> None:
+        logger.info(f'starting pipeline: {self.max_workers} workers, {self.max_pending_files} pending files')
+        self.pending_files = asyncio.Semaphore(self.max_pending_files)
+        self.parse_queue: asyncio.Queue[CountryJob] = asyncio.Queue(maxsize=self.max_pending_files)
+        self.archive_queue: asyncio.Queue[CountryJob] = asyncio.Queue(maxsize=self.max_pending_files)
+
+        # downloads and archiving are IO bound and go on threads, parsing is CPU bound and goes on processes
+        with ThreadPoolExecutor(max_workers=self.max_workers) as io_pool, \
+                ProcessPoolExecutor(max_workers=self.max_workers) as parse_pool:
+            workers = [
+                *(asyncio.create_task(self._parse_worker(parse_pool)) for _ in range(self.max_workers)),
+                *(asyncio.create_task(self._archive_worker(io_pool)) for _ in range(self.max_workers)),
+            ]
+            await asyncio.gather(*(self._download(country, io_pool) for country in countries))
+            await self.parse_queue.join()
+            await self.archive_queue.join()
+            for worker in workers:
+                worker.cancel()
+
+            await asyncio.gather(*workers, return_exceptions=True)
+
+        logger.info('pipeline finished')
+
+    async def _download(self, country: AvailableCountry, io_pool: Executor) -> None:
+        loop = asyncio.get_running_loop()
+        await self.pending_files.acquire()
+        metrics: Optional[CountryMetrics] = None
+        try:
+            metrics = self.run_metrics.country(country.name)
+            logger.info(f'starting handling country: {country.name}')
+            job = CountryJob(country=country, file_handler=get_file_handler(country), metrics=metrics)
+            started = time.perf_counter()
+            job.raw_mnp_file = await loop.run_in_executor(
+                io_pool, profiled, f'{country.name}.download', job.file_handler.get_file,
+            )
+            metrics.download_seconds = time.perf_counter() - started
+            metrics.download_bytes = os.path.getsize(get_local_file(job.raw_mnp_file))
+        except FileNotChangedError:
+            logger.info(f'skip {country.name}: no new file since the last run')
+            self._skip_download(country, metrics, STATUS_NOT_CHANGED)
+            return
+        except GetFileError:
+            self._skip_download(country, metrics, STATUS_FAILED)
+            return
+        except Exception as e:
+            logger.exception(e, exc_info=True)
+            self._skip_download(country, metrics, STATUS_FAILED)
+            return
+
+        await self.parse_queue.put(job)
+
+    async def _parse_worker(self, parse_pool: Executor) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self.parse_queue.get()
+            try:
+                started = time.perf_counter()
+                if use_chunked_parse(job.country, job.raw_mnp_file):
+                    parse_result = await asyncio.to_thread(
+                        profiled,
+                        f'{job.country.name}.parse',
+                        save_parse_result_chunked,
+                        job.country,
+                        job.raw_mnp_file,
+                        parse_pool,
+                        settings.parse_chunk_size,
+                        self.run_timestamp,
+                    )
+                else:
+                    parse_result = await loop.run_in_executor(
+                        parse_pool, parse_country, job.country, job.raw_mnp_file, self.run_timestamp,
+                    )
+
+                job.metrics.record_parse(
+                    parse_result.rows_read,
+                    parse_result.hlr_records,
+                    parse_result.hlr3_records,
+                    parse_result.output_bytes,
+                    time.perf_counter() - started,
+                    parse_result.row_errors,
+                )
+
+                if parse_result.hlr_records == 0 or parse_result.hlr3_records == 0:
+                    logger.warning(f'Check parse result for {job.country.name}')
+                    job.metrics.status = STATUS_EMPTY
+                    self._finish(job.country)
+                else:
+                    await self.archive_queue.put(job)
+            except Exception as e:
+                logger.exception(e, exc_info=True)
+                job.metrics.status = STATUS_FAILED
+                self._finish(job.country)
+            finally:
+                self.parse_queue.task_done()
+
+    async def _archive_worker(self, io_pool: Executor) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self.archive_queue.get()
+            try:
+                await loop.run_in_executor(io_pool, profiled, f'{job.country.name}.archive', self._archive, job)
+                job.metrics.status = STATUS_OK
+            except Exception as e:
+                logger.exception(e, exc_info=True)
+                job.metrics.status = STATUS_FAILED
+            finally:
+                self._finish(job.country)
+                self.archive_queue.task_done()
+
+    @staticmethod
+    def _archive(job: CountryJob) -> None:
+        local_file = get_local_file(job.raw_mnp_file)
+        started = time.perf_counter()
+        archive = archive_file(local_file, job.country.name)
+        job.metrics.record_archive(os.path.getsize(local_file), os.path.getsize(archive), time.perf_counter() - started)
+        logger.debug(f'remove raw mnp file: {local_file}')
+        os.remove(local_file)
+        job.file_handler.mark_processed()
+
+    def _skip_download(self, country: AvailableCountry, metrics: Optional[CountryMetrics], status: str) -> None:
+        # metrics are None when getting them failed
+        if metrics is not None:
+            metrics.status = status
+
+        self._finish(country)
+
+    def _finish(self, country: AvailableCountry) -> None:
+        self.pending_files.release()
+        logger.info(f'finished handling country: {country.name}')
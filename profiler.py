@@ -0,0 +1,96 @@
+import contextlib
+import cProfile
+import io
+import os
+import pstats
+import time
+import tracemalloc
+from typing import Callable, ContextManager, Iterator, Optional, TypeVar
+
+from logger_config import configure_logger
+
+logger = configure_logger(__name__)
+
+T = TypeVar('T')
+
+TOP_ENTRIES = 25
+TRACEMALLOC_FRAMES = 5
+
+# set by enable_profiling, worker processes forked afterwards inherit it
+_profile_directory: Optional[str] = None
+
+
+def enable_profiling(directory: str) -> None:
+    """
+    Profile every stage of the run into directory: <stage>.prof (cProfile stats for pstats, snakeviz, ...)
+    and <stage>.txt (top functions by cumulative time and top allocations of the stage)
+    """
+    global _profile_directory
+    os.makedirs(directory, exist_ok=True)
+    _profile_directory = directory
+    tracemalloc.start(TRACEMALLOC_FRAMES)
+    logger.info(f'profiling enabled, reports go to {directory}')
+
+
+def profile_stage(name: str) -> ContextManager[None]:
+    # a no-op context unless profiling is enabled
+    if _profile_directory is None:
+        return contextlib.nullcontext()
+
+    return _profiled_stage(name, _profile_directory)
+
+
+def profiled(name: str, function: Callable[..., T], *args) -> T:
+    # profile_stage for functions handed to executors, the profile belongs to the thread or process running them
+    with profile_stage(name):
+        return function(*args)
+
+
+@contextlib.contextmanager
+def _profiled_stage(name: str, directory: str) -> Iterator[None]:
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+    # snapshots are taken outside of the profiled section, they are expensive
+    before = tracemalloc.take_snapshot()
+    profile = cProfile.Profile()
+    started = time.perf_counter()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        seconds = time.perf_counter() - started
+        after = tracemalloc.take_snapshot()
+        base = os.path.join(directory, name)
+        profile.dump_stats(f'{base}.prof')
+        with open(f'{base}.txt', 'w') as f:
+            f.write(_format_report(name, seconds, profile, before, after))
+
+        logger.info(f'profile of {name} ({seconds:.2f}s) written to {base}.prof and {base}.txt')
+
+
+def _format_report(
+        name: str,
+        seconds: float,
+        profile: cProfile.Profile,
+        before: tracemalloc.Snapshot,
+        after: tracemalloc.Snapshot,
+) -> str:
+    report = io.StringIO()
+    report.write(f'stage {name}: {seconds:.3f}s, pid {os.getpid()}\n\n')
+
+    report.write(f'top {TOP_ENTRIES} functions by cumulative time\n')
+    pstats.Stats(profile, stream=report).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP_ENTRIES)
+
+    # tracemalloc is process wide, stages running concurrently in other threads show up here as well
+    filters = [
+        tracemalloc.Filter(False, file)
+        for file in (__file__, tracemalloc.__file__, cProfile.__file__, pstats.__file__, contextlib.__file__)
+    ]
+    current, peak = tracemalloc.get_traced_memory()
+    report.write(f'traced memory: current {current / 1024:.1f} KiB, peak {peak / 1024:.1f} KiB\n')
+    report.write(f'top {TOP_ENTRIES} allocations kept by the stage\n')
+    for stat in after.filter_traces(filters).compare_to(before.filter_traces(filters), 'lineno')[:TOP_ENTRIES]:
+        report.write(f'{stat}\n')
+
+    return report.getvalue()
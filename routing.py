@@ -0,0 +1,303 @@
+"""
+Local resolution of numbers the way HLR3 routes them: a ported number (full hlr file) takes precedence,
+otherwise the longest matching dial code of the refbook (refbook_for_hlr_2.csv) gives the mccmnc.
+Ported numbers are kept as a sorted array of keys with a parallel array of mccmnc indexes and looked up by bisection,
+a snapshot file holds both arrays and is mapped into memory, so loading it costs no parsing.
+
+    python -m routing build --refbook refbook_for_hlr_2.csv --output routing.snapshot
+    python -m routing resolve --snapshot routing.snapshot 77011234567 37120000001
+    python -m routing serve --snapshot routing.snapshot --socket /tmp/routing.sock
+"""
+import argparse
+import csv
+import json
+import mmap
+import os
+import socketserver
+import stat
+import struct
+import sys
+import time
+from array import array
+from bisect import bisect_left
+from itertools import groupby
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from logger_config import configure_logger
+
+logger = configure_logger(__name__)
+
+_MAGIC = b'MNPROUTE1\n'
+# magic, header length, JSON header, keys (uint64) and mccmnc indexes (uint32) in native byte order
+_HEADER_LENGTH = struct.Struct('<Q')
+# a number is keyed as int('1' + number), numbers of up to 18 digits fit into an uint64 and keep leading zeros
+MAX_NUMBER_LENGTH = 18
+
+
+class Route(NamedTuple):
+    mccmnc: str
+    # matched dial code, None for a ported number
+    prefix: Optional[str] = None
+
+
+def number_key(number: str) -> Optional[int]:
+    # ASCII digits only: str.isdigit also takes '²' or '٣', which int() rejects or reads as other digits
+    if not (number.isascii() and number.isdecimal()) or len(number) > MAX_NUMBER_LENGTH:
+        return None
+
+    return int('1' + number)
+
+
+class RoutingTable:
+
+    def __init__(
+            self,
+            keys: Sequence[int],
+            values: Sequence[int],
+            mccmnc_table: List[str],
+            prefixes: Dict[str, str],
+    ):
+        """
+        :param keys: sorted number keys of ported numbers
+        :param values: index into mccmnc_table of every key
+        :param prefixes: dial code -> mccmnc
+        """
+        self.keys = keys
+        self.values = values
+        self.mccmnc_table = mccmnc_table
+        self.prefixes = prefixes
+        self.prefix_lengths = sorted({len(prefix) for prefix in prefixes}, reverse=True)
+        self._snapshot: Optional[mmap.mmap] = None
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def resolve(self, number: str) -> Optional[Route]:
+        key = number_key(number)
+        if key is None:
+            return None
+
+        index = bisect_left(self.keys, key)
+        if index < len(self.keys) and self.keys[index] == key:
+            return Route(self.mccmnc_table[self.values[index]])
+
+        for length in self.prefix_lengths:
+            if length <= len(number) and (mccmnc := self.prefixes.get(number[:length])) is not None:
+                return Route(mccmnc, number[:length])
+
+        return None
+
+    def resolve_many(self, numbers: Iterable[str]) -> List[Optional[Route]]:
+        resolve = self.resolve
+        return [resolve(number) for number in numbers]
+
+    @classmethod
+    def build(cls, hlr_file: str, refbook_file: Optional[str] = None) -> 'RoutingTable':
+        """
+        Build the table from a hlr3 file (dnis;mccmnc;active_from;...), a number repeated in it keeps its latest record,
+        and a HLR2 refbook (DIAL_CODE;MCC_MNC with a header line)
+        """
+        started = time.perf_counter()
+        mccmnc_indexes: Dict[str, int] = {}
+        keys = array('Q')
+        values = array('I')
+        active_from = array('q')
+        with open(hlr_file, 'r', newline='') as f:
+            for row in csv.reader(f, delimiter=';'):
+                if not row or (key := number_key(row[0])) is None:
+                    continue
+
+                keys.append(key)
+                values.append(mccmnc_indexes.setdefault(row[1], len(mccmnc_indexes)))
+                active_from.append(int(row[2]) if row[2] else 0)
+
+        sorted_keys, sorted_values = _latest_records(keys, values, active_from)
+        prefixes = read_refbook(refbook_file) if refbook_file else {}
+        mccmnc_table = sorted(mccmnc_indexes, key=mccmnc_indexes.__getitem__)
+        logger.info(
+            f'routing table built in {time.perf_counter() - started:.1f}s: '
+            f'{len(sorted_keys)} ported numbers, {len(prefixes)} dial codes',
+        )
+        return cls(sorted_keys, sorted_values, mccmnc_table, prefixes)
+
+    def save(self, snapshot_file: str) -> None:
+        header = json.dumps({
+            'count': len(self.keys),
+            'byteorder': sys.byteorder,
+            'mccmnc': self.mccmnc_table,
+            'prefixes': self.prefixes,
+        }).encode()
+        # keys are aligned to 8 bytes so the mapped file can be cast to uint64
+        padding = -(len(_MAGIC) + _HEADER_LENGTH.size + len(header)) % 8
+        tmp_snapshot_file = f'{snapshot_file}.tmp'
+        with open(tmp_snapshot_file, 'wb') as f:
+            f.write(_MAGIC)
+            f.write(_HEADER_LENGTH.pack(len(header) + padding))
+            f.write(header + b' ' * padding)
+            f.write(memoryview(self.keys).cast('B'))
+            f.write(memoryview(self.values).cast('B'))
+
+        os.replace(tmp_snapshot_file, snapshot_file)
+        logger.info(f'routing snapshot saved to {snapshot_file}')
+
+    @classmethod
+    def load(cls, snapshot_file: str) -> 'RoutingTable':
+        with open(snapshot_file, 'rb') as f:
+            snapshot = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if snapshot[:len(_MAGIC)] != _MAGIC:
+            raise ValueError(f'{snapshot_file} is not a routing snapshot')
+
+        offset = len(_MAGIC)
+        header_length, = _HEADER_LENGTH.unpack_from(snapshot, offset)
+        offset += _HEADER_LENGTH.size
+        header = json.loads(snapshot[offset:offset + header_length])
+        if header['byteorder'] != sys.byteorder:
+            raise ValueError(f'{snapshot_file} was built on a {header["byteorder"]} endian host')
+
+        offset += header_length
+
+        count = header['count']
+        view = memoryview(snapshot)
+        keys = view[offset:offset + count * 8].cast('Q')
+        values = view[offset + count * 8:offset + count * 12].cast('I')
+        table = cls(keys, values, header['mccmnc'], header['prefixes'])
+        table._snapshot = snapshot
+        return table
+
+
+def _latest_records(keys: array, values: array, active_from: array) -> Tuple[array, array]:
+    """
+    Sort the records by key and keep the latest one of every key: the highest active_from,
+    of equal ones the later line, as in hlr_sorter
+    :return: sorted keys and their values
+    """
+    if not keys:
+        return array('Q'), array('I')
+
+    try:
+        # numpy is an optional dependency, it sorts the arrays in place of a list of boxed ints per number
+        import numpy as np
+    except ImportError:
+        return _latest_records_without_numpy(keys, values, active_from)
+
+    np_keys = np.frombuffer(keys, dtype=np.uint64)
+    # lexsort is stable and sorts by the last key first: by number, then active_from, then line
+    order = np.lexsort((np.frombuffer(active_from, dtype=np.int64), np_keys))
+    np_keys = np_keys[order]
+    # the last record of every run of equal keys
+    latest = np.append(np_keys[1:] != np_keys[:-1], True)
+    sorted_keys = array('Q', np_keys[latest].tobytes())
+    sorted_values = array('I', np.frombuffer(values, dtype=np.uint32)[order][latest].tobytes())
+    return sorted_keys, sorted_values
+
+
+def _latest_records_without_numpy(keys: array, values: array, active_from: array) -> Tuple[array, array]:
+    # stable sort: of equal numbers with the same active_from the later line wins
+    order = sorted(range(len(keys)), key=keys.__getitem__)
+    sorted_keys = array('Q')
+    sorted_values = array('I')
+    for key, group in groupby(order, key=keys.__getitem__):
+        latest = next(group)
+        for index in group:
+            if active_from[index] >= active_from[latest]:
+                latest = index
+
+        sorted_keys.append(key)
+        sorted_values.append(values[latest])
+
+    return sorted_keys, sorted_values
+
+
+def read_refbook(refbook_file: str) -> Dict[str, str]:
+    prefixes = {}
+    with open(refbook_file, 'r', newline='') as f:
+        next(f, None)
+        for row in csv.reader(f, delimiter=';', quotechar='"'):
+            if len(row) > 1:
+                prefixes[row[0]] = row[1]
+
+    return prefixes
+
+
+def build_snapshot(hlr_file: str, refbook_file: Optional[str], snapshot_file: str) -> RoutingTable:
+    table = RoutingTable.build(hlr_file, refbook_file)
+    table.save(snapshot_file)
+    return table
+
+
+def format_route(number: str, route: Optional[Route]) -> str:
+    # number;mccmnc;dial code, empty fields when the number does not resolve
+    if route is None:
+        return f'{number};;\n'
+
+    return f'{number};{route.mccmnc};{route.prefix or ""}\n'
+
+
+class _LookupHandler(socketserver.StreamRequestHandler):
+    # a number per line in, a format_route line out
+
+    def handle(self) -> None:
+        table: RoutingTable = self.server.routing_table
+        for line in self.rfile:
+            # a line that is not UTF-8 does not resolve, the client keeps its connection
+            number = line.strip().decode(errors='replace')
+            self.wfile.write(format_route(number, table.resolve(number)).encode())
+
+
+class LookupServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, routing_table: RoutingTable):
+        # a socket left by a previous server is replaced, any other file at the path is an error
+        if os.path.exists(socket_path) and stat.S_ISSOCK(os.stat(socket_path).st_mode):
+            os.remove(socket_path)
+
+        super().__init__(socket_path, _LookupHandler)
+        self.routing_table = routing_table
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description='Resolve numbers from ported numbers and refbook dial codes')
+    commands = arg_parser.add_subparsers(dest='command', required=True)
+    build_parser = commands.add_parser('build', help='build a snapshot from the full hlr file and the refbook')
+    # defaults come straight from the environment (with .env), the tool does not need the variables of a full run
+    snapshot_file = os.environ.get('ROUTING_SNAPSHOT_FILE', '')
+    build_parser.add_argument('--hlr', default=os.environ.get('FULL_HLR_FILE', ''), help='default FULL_HLR_FILE')
+    build_parser.add_argument(
+        '--refbook',
+        default=os.environ.get('HLR3_REFBOOK_FILE', ''),
+        help='default HLR3_REFBOOK_FILE',
+    )
+    build_parser.add_argument('--output', default=snapshot_file, help='default ROUTING_SNAPSHOT_FILE')
+    for name, help_text in (('resolve', 'resolve numbers'), ('serve', 'serve lookups on a unix socket')):
+        command_parser = commands.add_parser(name, help=help_text)
+        command_parser.add_argument(
+            '--snapshot',
+            default=snapshot_file,
+            help='default ROUTING_SNAPSHOT_FILE',
+        )
+
+    commands.choices['resolve'].add_argument('numbers', nargs='*', help='numbers, read from stdin when omitted')
+    commands.choices['serve'].add_argument('--socket', required=True)
+    args = arg_parser.parse_args()
+    if args.command == 'build' and not (args.hlr and args.output):
+        arg_parser.error('no hlr or snapshot file, set FULL_HLR_FILE and ROUTING_SNAPSHOT_FILE or --hlr and --output')
+
+    if args.command != 'build' and not args.snapshot:
+        arg_parser.error('no snapshot file, set ROUTING_SNAPSHOT_FILE or --snapshot')
+
+    if args.command == 'build':
+        build_snapshot(args.hlr, args.refbook, args.output)
+    elif args.command == 'resolve':
+        table = RoutingTable.load(args.snapshot)
+        for number in args.numbers or (line.strip() for line in sys.stdin):
+            sys.stdout.write(format_route(number, table.resolve(number)))
+    else:
+        with LookupServer(args.socket, RoutingTable.load(args.snapshot)) as server:
+            logger.info(f'routing lookups on {args.socket}')
+            server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Push of files to the SMSSW server over one SSH session.
+A file is uploaded by SFTP to a temporary name and renamed over the destination atomically,
+it is not uploaded at all when the remote copy has the same sha256.
+The remote checksum needs sha256sum on the server, without it the whole file is sent
+"""
+import hashlib
+import shlex
+from dataclasses import dataclass
+from typing import Optional
+
+import paramiko
+
+from logger_config import configure_logger
+
+logger = configure_logger(__name__)
+
+
+@dataclass
+class PushResult:
+    bytes_sent: int = 0
+    skipped: bool = False
+
+
+def connect_ssh(server: str, port: int, user: str, compress: bool = False) -> paramiko.SSHClient:
+    ssh = paramiko.SSHClient()
+    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    ssh.connect(
+        server,
+        port,
+        username=user,
+        compress=compress,
+        disabled_algorithms={
+            'pubkeys': ['rsa-sha2-512', 'rsa-sha2-256'],
+        },
+    )
+    return ssh
+
+
+class SftpPusher:
+    """
+    Context manager holding the SSH and SFTP sessions, every push of the run goes through them
+    """
+
+    def __init__(self, server: str, port: int, user: str, compress: bool = True):
+        self.server = server
+        self.port = port
+        self.user = user
+        self.compress = compress
+        self.ssh: Optional[paramiko.SSHClient] = None
+        self.sftp: Optional[paramiko.SFTPClient] = None
+
+    def __enter__(self) -> 'SftpPusher':
+        self.ssh = connect_ssh(self.server, self.port, self.user, self.compress)
+        self.sftp = self.ssh.open_sftp()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.sftp.close()
+        self.ssh.close()
+
+    def push(self, source_file: str, destination_path: str) -> PushResult:
+        logger.info(f'Pushing {source_file} to {self.server}:{destination_path}')
+        with open(source_file, 'rb') as f:
+            digest = hashlib.file_digest(f, 'sha256').hexdigest()
+
+        if self._remote_digest(destination_path) == digest:
+            logger.info(f'{self.server}:{destination_path} is up to date, skip the upload')
+            return PushResult(skipped=True)
+
+        tmp_path = f'{destination_path}.tmp'
+        bytes_sent = self.sftp.put(source_file, tmp_path, confirm=True).st_size
+
+        self.sftp.posix_rename(tmp_path, destination_path)
+        logger.info(f'pushed {bytes_sent} bytes to {self.server}:{destination_path}')
+        return PushResult(bytes_sent=bytes_sent)
+
+    def _remote_digest(self, path: str) -> Optional[str]:
+        """
+        :return: sha256 of the remote file, None when it could not be computed
+        """
+        output = self._execute(f'sha256sum -- {shlex.quote(path)}')
+        if output is None:
+            return None
+
+        return output.split(maxsplit=1)[0]
+
+    def _execute(self, command: str) -> Optional[str]:
+        # output of a remote command, None when it failed
+        _, stdout, stderr = self.ssh.exec_command(command)
+        # read before the exit status, a full channel window would block the command
+        output = stdout.read()
+        if stdout.channel.recv_exit_status() != 0:
+            logger.debug(f'remote command failed: {stderr.read().decode().strip()}')
+            return None
+
+        return output.decode()
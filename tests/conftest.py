@@ -0,0 +1,29 @@
+import os
+import tempfile
+
+# settings are read from the environment on first use, before any test module uses them
+_work_directory = tempfile.mkdtemp(prefix='mnp-tests-')
+for _variable, _directory in {
+    'TMP_DIRECTORY': 'tmp',
+    'FTP_DIRECTORY': 'ftp',
+    'HLR_DIRECTORY': 'hlr',
+    'ARCHIVE_DIRECTORY': 'archive',
+}.items():
+    os.environ[_variable] = os.path.join(_work_directory, _directory)
+    for _prefix in ('georgia', 'kazakhstan', 'belarus', 'latvia'):
+        os.makedirs(os.path.join(os.environ[_variable], _prefix), exist_ok=True)
+
+os.environ['FULL_HLR_FILE'] = os.path.join(_work_directory, 'full_hlr.csv')
+os.environ['LOG_FILE'] = os.path.join(_work_directory, 'tests.log')
+# an empty value wins over .env, tests must not write into the real index
+os.environ['MNP_INDEX_FILE'] = ''
+for _variable in (
+        'SMSSW_SERVER', 'SMSSW_SERVER_USER', 'SMSSW_FULL_HLR_FILE_PATH',
+        'GEORGIA_FTP_SERVER', 'GEORGIA_FTP_USER', 'GEORGIA_FTP_PASSWORD',
+        'KAZAKHSTAN_FTP_SERVER', 'KAZAKHSTAN_FTP_USER', 'KAZAKHSTAN_FTP_PASSWORD',
+        'BELARUS_SOURCE_DIRECTORY', 'LATVIA_SOURCE_DIRECTORY',
+):
+    os.environ[_variable] = 'test'
+
+os.environ['GEORGIA_FTP_PORT'] = '21'
+os.environ['KAZAKHSTAN_FTP_PORT'] = '21'
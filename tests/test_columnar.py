@@ -0,0 +1,62 @@
+import csv
+import datetime
+import io
+import random
+import time
+
+import pytest
+
+from parsers.timestamps import TimestampConverter
+
+np = pytest.importorskip('numpy')
+columnar = pytest.importorskip('parsers.columnar')
+
+
+@pytest.fixture
+def berlin_time(monkeypatch):
+    # a timezone with DST changes, their days go through the converter value by value
+    monkeypatch.setenv('TZ', 'Europe/Berlin')
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+@pytest.mark.parametrize('fmt', ['%Y-%m-%d %H:%M:%S', '%d.%m.%Y %H:%M:%S'])
+def test_timestamps_of_a_column_match_the_converter(berlin_time, fmt):
+    convert = TimestampConverter(fmt, fallback=datetime.datetime.fromisoformat if fmt.startswith('%Y') else None)
+    generator = random.Random(1)
+    values = [
+        (datetime.datetime(2024, 1, 1) + datetime.timedelta(seconds=generator.randrange(366 * 86400))).strftime(fmt)
+        for _ in range(5000)
+    ]
+    dst_changes = [datetime.datetime(2024, 3, 31, 3, 30), datetime.datetime(2024, 10, 27, 2, 30)]
+    values += [value.strftime(fmt) for value in dst_changes]
+    if fmt.startswith('%Y'):
+        # not of the format: the fallback parser takes them
+        values += ['2024-01-02T10:00:00', '2024-01-02 10:00:00.500000', '2024-01-02 10:00']
+
+    timestamps = columnar._to_timestamps(np.array(values), convert)
+
+    assert timestamps.tolist() == [str(convert(value)) for value in values]
+
+
+def test_kazakhstan_block_matches_the_row_parser():
+    from parsers.parser import HLR3_CSV_FORMAT, KazakhstanMnpParser
+
+    rows = [
+        ['77011234567', '1', '02', 'R1', '2023-01-02 10:00:00', '2'],
+        [],
+        ['77017654321', '2', '07', 'R2', '2023-01-02 23:59:59', '1'],
+        ['77470000001', '3', '77', 'R3', '2023-03-05T08:30:00', '1'],
+    ]
+    parser = KazakhstanMnpParser()
+    lines = ['Number,OwnerId,MNC,Route,PortDate,RowCount\n', *(','.join(row) + '\n' for row in rows)]
+    records = list(parser._parse_lines(lines, skip_header=True))
+
+    block = columnar.kazakhstan_block(rows, parser.port_date_to_timestamp)
+
+    hlr3_f = io.StringIO()
+    csv.writer(hlr3_f, **HLR3_CSV_FORMAT).writerows(record.hlr3_row() for record in records)
+    assert block.hlr3_text == hlr3_f.getvalue()
+    assert (block.hlr_records, block.hlr3_records) == (3, 3)
@@ -0,0 +1,46 @@
+import os
+
+import pytest
+
+import utils
+from utils import concatenate_files
+
+
+@pytest.fixture
+def sources(tmp_path):
+    first = tmp_path / 'latvia.csv'
+    first.write_bytes(os.urandom(3 * utils.COPY_BUFFER_SIZE + 11) + b'\n')
+    second = tmp_path / 'kazakhstan.csv'
+    second.write_bytes(b'77011234567;40101;1700000000;;\n' * 1000)
+    return [first, second]
+
+
+def test_join_counts_lines_in_one_read(sources, tmp_path, monkeypatch):
+    content = b''.join(source.read_bytes() for source in sources)
+    # with count_lines the files go through the counted buffer only
+    monkeypatch.setattr(utils, '_copy_file_range', None)
+    monkeypatch.setattr(utils, '_sendfile', None)
+
+    join_result = concatenate_files([str(source) for source in sources], str(tmp_path / 'full.csv'), count_lines=True)
+
+    assert (tmp_path / 'full.csv').read_bytes() == content
+    assert (join_result.files, join_result.bytes, join_result.lines) == (2, len(content), content.count(b'\n'))
+
+
+def test_short_kernel_copy_is_finished(sources, tmp_path, monkeypatch):
+    content = b''.join(source.read_bytes() for source in sources)
+    calls = []
+
+    def copy_one_block(in_fd: int, out_fd: int, count: int) -> int:
+        # the kernel copies a single block of every file, then reports no progress
+        calls.append(count)
+        return os.sendfile(out_fd, in_fd, None, 4096) if len(calls) % 2 else 0
+
+    monkeypatch.setattr(utils, '_copy_file_range', copy_one_block)
+    monkeypatch.setattr(utils, '_sendfile', lambda in_fd, out_fd, count: 0)
+
+    join_result = concatenate_files([str(source) for source in sources], str(tmp_path / 'full.csv'))
+
+    assert (tmp_path / 'full.csv').read_bytes() == content
+    assert join_result.bytes == len(content)
+    assert len(calls) == 4
@@ -0,0 +1,73 @@
+import os
+
+import pytest
+
+from config import settings
+from delta import compute_delta, delta_files, snapshot_file
+from file_handlers.file_handler import commit_all_delta_files, join_all_delta_files
+
+
+@pytest.fixture
+def hlr_directory(tmp_path, monkeypatch):
+    for prefix in ('latvia', 'kazakhstan', 'belarus'):
+        (tmp_path / 'hlr' / prefix).mkdir(parents=True)
+
+    monkeypatch.setattr(settings, 'hlr_directory', str(tmp_path / 'hlr'))
+    monkeypatch.setattr(settings, 'full_hlr_file', str(tmp_path / 'full_hlr_3.csv'))
+    return tmp_path / 'hlr'
+
+
+def _save(hlr_directory, prefix: str, content: str) -> str:
+    # what save_parse_result does with HLR_DELTA, a new file replaces the one the snapshot is linked to
+    hlr3_file = str(hlr_directory / prefix / f'{prefix}.csv')
+    with open(f'{hlr3_file}.tmp', 'w') as f:
+        f.write(content)
+
+    os.replace(f'{hlr3_file}.tmp', hlr3_file)
+    compute_delta(snapshot_file(hlr3_file), hlr3_file)
+    return hlr3_file
+
+
+def test_first_run_has_no_delta_and_creates_snapshots(hlr_directory):
+    hlr3_file = _save(hlr_directory, 'latvia', '37120000001;24701;1700000000;;\n')
+
+    hlr3_files = join_all_delta_files()
+
+    assert hlr3_files == [hlr3_file]
+    assert not any(os.path.exists(file) for file in delta_files(settings.full_hlr_file))
+
+    commit_all_delta_files(hlr3_files)
+
+    assert os.path.exists(snapshot_file(hlr3_file))
+    assert not any(os.path.exists(file) for file in delta_files(hlr3_file))
+
+
+def test_delta_against_the_last_pushed_snapshot(hlr_directory):
+    commit_all_delta_files([
+        _save(hlr_directory, 'latvia', '37120000001;24701;1700000000;;\n37120000002;24701;1700000000;;\n'),
+        _save(hlr_directory, 'kazakhstan', '77011234567;40101;1700000000;;\n'),
+    ])
+    # changed and removed in the next run
+    _save(hlr_directory, 'latvia', '37120000001;24702;1700000500;;\n')
+    _save(hlr_directory, 'kazakhstan', '77011234567;40101;1700000500;;\n77017654321;40102;1700000500;;\n')
+
+    join_all_delta_files()
+
+    full_delta_file, full_removed_file = delta_files(settings.full_hlr_file)
+    with open(full_delta_file) as f:
+        assert f.read() == '37120000001;24702;1700000500;;\n77017654321;40102;1700000500;;\n'
+
+    with open(full_removed_file) as f:
+        assert f.read() == '37120000002\n'
+
+
+def test_delta_withheld_while_a_country_has_no_snapshot(hlr_directory):
+    commit_all_delta_files([_save(hlr_directory, 'latvia', '37120000001;24701;1700000000;;\n')])
+    _save(hlr_directory, 'latvia', '37120000001;24702;1700000500;;\n')
+    # a new country: its delta holds all of its numbers and none of the removed ones
+    _save(hlr_directory, 'belarus', '375291234567;25702;1700000500;;\n')
+
+    hlr3_files = join_all_delta_files()
+
+    assert len(hlr3_files) == 2
+    assert not any(os.path.exists(file) for file in delta_files(settings.full_hlr_file))
@@ -0,0 +1,198 @@
+import ftplib
+import os
+import threading
+from types import SimpleNamespace
+
+import pytest
+from pyftpdlib.authorizers import DummyAuthorizer
+from pyftpdlib.handlers import FTPHandler
+from pyftpdlib.servers import FTPServer
+
+from config import settings
+from utils import connect_ftp, download_file
+
+FILE_NAME = 'mnp.csv'
+FILE_SIZE = 3 * 1024 * 1024 + 7
+
+
+@pytest.fixture
+def ftp_source(tmp_path, monkeypatch):
+    """
+    FTP server on a free local port serving one file
+    :return: settings of the server and the content of the file
+    """
+    root = tmp_path / 'ftp'
+    root.mkdir()
+    content = os.urandom(FILE_SIZE)
+    (root / FILE_NAME).write_bytes(content)
+
+    authorizer = DummyAuthorizer()
+    authorizer.add_user('mnp', 'secret', str(root), perm='elr')
+    handler = type('Handler', (FTPHandler,), {'authorizer': authorizer})
+    server = FTPServer(('127.0.0.1', 0), handler)
+    stopped = threading.Event()
+
+    def serve():
+        while not stopped.is_set():
+            server.serve_forever(timeout=0.05, blocking=False)
+
+        server.close_all()
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+
+    download_directory = tmp_path / 'tmp'
+    download_directory.mkdir()
+    monkeypatch.setattr(settings, 'tmp_directory', str(download_directory))
+    monkeypatch.setattr(settings, 'ftp_retries', 2)
+    ftp_settings = SimpleNamespace(
+        root=str(root),
+        ftp_server='127.0.0.1',
+        ftp_port=server.address[1],
+        ftp_user='mnp',
+        ftp_password='secret',
+    )
+    yield ftp_settings, content
+
+    stopped.set()
+    thread.join()
+
+
+def test_single_stream(ftp_source):
+    ftp_settings, content = ftp_source
+    ftp = connect_ftp(ftp_settings)
+    try:
+        path = download_file(FILE_NAME, ftp, len(content))
+    finally:
+        ftp.close()
+
+    assert path.read_bytes() == content
+    assert not os.path.exists(f'{path}.part')
+
+
+def test_resume_of_partial_file(ftp_source):
+    ftp_settings, content = ftp_source
+    part_file = os.path.join(settings.tmp_directory, f'{FILE_NAME}.part')
+    with open(part_file, 'wb') as f:
+        f.write(content[:1000])
+
+    ftp = connect_ftp(ftp_settings)
+    retr_offsets = []
+    retrbinary = ftp.retrbinary
+    ftp.retrbinary = lambda cmd, callback, rest=None: retr_offsets.append(rest) or retrbinary(cmd, callback, rest=rest)
+    try:
+        path = download_file(FILE_NAME, ftp, len(content))
+    finally:
+        ftp.close()
+
+    assert retr_offsets == [1000]
+    assert path.read_bytes() == content
+
+
+@pytest.mark.parametrize('modified', [None, '20991231000000'])
+def test_restart_when_remote_file_changed(ftp_source, modified):
+    ftp_settings, content = ftp_source
+    part_file = os.path.join(settings.tmp_directory, f'{FILE_NAME}.part')
+    with open(part_file, 'wb') as f:
+        f.write(content[:1000])
+
+    # written before the remote file was modified: asked with MDTM, or given from the MLSD facts
+    remote_modified = os.path.getmtime(os.path.join(ftp_settings.root, FILE_NAME))
+    os.utime(part_file, (remote_modified - 3600, remote_modified - 3600))
+    ftp = connect_ftp(ftp_settings)
+    retr_offsets = []
+    retrbinary = ftp.retrbinary
+    ftp.retrbinary = lambda cmd, callback, rest=None: retr_offsets.append(rest) or retrbinary(cmd, callback, rest=rest)
+    try:
+        path = download_file(FILE_NAME, ftp, len(content), modified=modified)
+    finally:
+        ftp.close()
+
+    assert retr_offsets == [None]
+    assert path.read_bytes() == content
+
+
+@pytest.mark.parametrize('size_known', [True, False])
+def test_restart_when_part_is_bigger_than_remote_file(ftp_source, size_known):
+    ftp_settings, content = ftp_source
+    part_file = os.path.join(settings.tmp_directory, f'{FILE_NAME}.part')
+    # left by a download of a bigger file that was replaced
+    with open(part_file, 'wb') as f:
+        f.write(content + b'of the replaced file')
+
+    ftp = connect_ftp(ftp_settings)
+    try:
+        path = download_file(FILE_NAME, ftp, len(content) if size_known else None)
+    finally:
+        ftp.close()
+
+    assert path.read_bytes() == content
+
+
+def test_reconnect_after_dropped_session(ftp_source):
+    ftp_settings, content = ftp_source
+    ftp = connect_ftp(ftp_settings)
+    retrbinary = ftp.retrbinary
+
+    def dropping_retrbinary(cmd, callback, rest=None):
+        # the session drops after the first block
+        def write_once(data):
+            callback(data)
+            raise EOFError
+
+        retrbinary(cmd, write_once, rest=rest)
+
+    ftp.retrbinary = dropping_retrbinary
+    try:
+        path = download_file(FILE_NAME, ftp, len(content), lambda: connect_ftp(ftp_settings))
+    finally:
+        ftp.close()
+
+    assert path.read_bytes() == content
+
+
+@pytest.mark.parametrize('segments', [2, 4])
+def test_segmented(ftp_source, monkeypatch, segments):
+    ftp_settings, content = ftp_source
+    monkeypatch.setattr(settings, 'ftp_segments', segments)
+    monkeypatch.setattr(settings, 'ftp_segment_min_size', 1024)
+    sessions = []
+
+    def connect() -> ftplib.FTP:
+        sessions.append(connect_ftp(ftp_settings))
+        return sessions[-1]
+
+    ftp = connect_ftp(ftp_settings)
+    try:
+        path = download_file(FILE_NAME, ftp, len(content), connect)
+    finally:
+        ftp.close()
+
+    assert len(sessions) == segments
+    assert path.read_bytes() == content
+    assert not [name for name in os.listdir(settings.tmp_directory) if '.part' in name]
+
+
+def test_segmented_resume_of_partial_segment(ftp_source, monkeypatch):
+    ftp_settings, content = ftp_source
+    monkeypatch.setattr(settings, 'ftp_segments', 3)
+    monkeypatch.setattr(settings, 'ftp_segment_min_size', 1024)
+    segment_size = -(-len(content) // 3)
+    # an interrupted run left the second segment half done and the third one complete
+    download_path = os.path.join(settings.tmp_directory, FILE_NAME)
+    with open(f'{download_path}.part1', 'wb') as f:
+        f.write(content[segment_size:segment_size + segment_size // 2])
+
+    with open(f'{download_path}.part2', 'wb') as f:
+        f.write(content[2 * segment_size:])
+
+    sessions = []
+
+    def connect() -> ftplib.FTP:
+        sessions.append(connect_ftp(ftp_settings))
+        return sessions[-1]
+
+    path = download_file(FILE_NAME, None, len(content), connect)
+
+    assert len(sessions) == 2
+    assert path.read_bytes() == content
@@ -0,0 +1,180 @@
+import http.client
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from config import settings
+from error.errors import Hlr3LoadError
+from hlr3_load import load_hlr3
+
+FULL_LINES = [f'37529{number:07d};25704;1700000000;;\n' for number in range(10)]
+DELTA_LINES = FULL_LINES[:7]
+
+
+class _RecordedConnection(http.client.HTTPConnection):
+    # every connection the loader opens, to check that none is left open
+    opened: list = []
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.opened.append(self)
+
+
+class _Hlr3Stub(BaseHTTPRequestHandler):
+    """
+    Mnp.Update stand-in: records every call with the lines of its file and answers them all as handled,
+    calls for a file in failing get a JSON-RPC error
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.open_connections += 1
+
+    def finish(self):
+        super().finish()
+        with self.server.lock:
+            self.server.open_connections -= 1
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        params = request['params']
+        with open(params['filePath']) as f:
+            lines = f.readlines()
+
+        with self.server.lock:
+            self.server.calls.append((request['method'], params['filePath'], params['replaceAll'], lines))
+
+        if params['filePath'] in self.server.failing:
+            response = {'jsonrpc': '2.0', 'id': request['id'], 'error': {'code': -1, 'message': 'load failed'}}
+        else:
+            result = {'handledLines': len(lines), 'successfullyLines': len(lines)}
+            response = {'jsonrpc': '2.0', 'id': request['id'], 'result': result}
+
+        body = json.dumps(response).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def hlr3_server(tmp_path, monkeypatch):
+    """
+    JSON-RPC stand-in of HLR3 on a free local port, settings point the load at it
+    :return: the server with its calls, failing file paths and open connection count
+    """
+    monkeypatch.setattr(_RecordedConnection, 'opened', [])
+    monkeypatch.setattr(http.client, 'HTTPConnection', _RecordedConnection)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Hlr3Stub)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.calls = []
+    server.failing = set()
+    server.open_connections = 0
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+    thread.start()
+
+    full_hlr_file = tmp_path / 'full_hlr_3.csv'
+    full_hlr_file.write_text(''.join(FULL_LINES))
+    batch_directory = tmp_path / 'batches'
+    batch_directory.mkdir()
+    monkeypatch.setattr(settings, 'tmp_directory', str(tmp_path))
+    monkeypatch.setattr(settings, 'full_hlr_file', str(full_hlr_file))
+    monkeypatch.setattr(settings, 'hlr3_load_url', f'http://127.0.0.1:{server.server_address[1]}/')
+    monkeypatch.setattr(settings, 'hlr3_batch_directory', str(batch_directory))
+    monkeypatch.setattr(settings, 'hlr3_batch_lines', 3)
+    monkeypatch.setattr(settings, 'hlr3_load_concurrency', 2)
+    monkeypatch.setattr(settings, 'hlr3_refbook_file', '')
+    monkeypatch.setattr(settings, 'hlr_delta', False)
+    yield server
+
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def delta(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, 'hlr_delta', True)
+    (tmp_path / 'full_hlr_3.delta.csv').write_text(''.join(DELTA_LINES))
+    (tmp_path / 'full_hlr_3.removed.csv').write_text('')
+
+
+def _wait_closed(server) -> bool:
+    """
+    :return: whether the loader closed its connections and the server saw them closed
+    """
+    if any(connection.sock is not None for connection in _RecordedConnection.opened):
+        return False
+
+    deadline = time.monotonic() + 5
+    while server.open_connections and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    return server.open_connections == 0
+
+
+def test_full_load_is_one_replace_all_call(hlr3_server, tmp_path, monkeypatch):
+    refbook_file = tmp_path / 'refbook_hlr2.csv'
+    refbook_file.write_text('DIAL_CODE;MCC_MNC\n37517;25701\n37529;25702\n')
+    monkeypatch.setattr(settings, 'hlr3_refbook_file', str(refbook_file))
+
+    load_result = load_hlr3(full_load=True)
+
+    assert [(method, replace_all) for method, _, replace_all, _ in hlr3_server.calls] == [('Mnp.Update', True)]
+    lines = hlr3_server.calls[0][3]
+    assert lines[:len(FULL_LINES)] == FULL_LINES
+    assert [line.split(';')[:2] for line in lines[len(FULL_LINES):]] == [['37517', '25701'], ['37529', '25702']]
+    assert (load_result.batches, load_result.handled_lines, load_result.successfully_lines) == (1, 12, 12)
+    assert os.listdir(settings.hlr3_batch_directory) == []
+    assert _wait_closed(hlr3_server)
+
+
+def test_delta_load_adds_batches(hlr3_server, delta):
+    load_result = load_hlr3()
+
+    calls = sorted(hlr3_server.calls, key=lambda call: call[1])
+    assert [replace_all for _, _, replace_all, _ in calls] == [False, False, False]
+    assert [line for *_, lines in calls for line in lines] == DELTA_LINES
+    assert (load_result.batches, load_result.handled_lines, load_result.successfully_lines) == (3, 7, 7)
+    assert os.listdir(settings.hlr3_batch_directory) == []
+    assert _wait_closed(hlr3_server)
+
+
+def test_full_load_instead_of_delta_with_removed_numbers(hlr3_server, delta, tmp_path):
+    (tmp_path / 'full_hlr_3.removed.csv').write_text('375290000099\n')
+
+    load_result = load_hlr3()
+
+    assert [replace_all for _, _, replace_all, _ in hlr3_server.calls] == [True]
+    assert load_result.handled_lines == len(FULL_LINES)
+
+
+def test_failed_delta_batch_closes_session(hlr3_server, delta):
+    hlr3_server.failing.add(os.path.join(settings.hlr3_batch_directory, 'hlr3_batch.1'))
+
+    with pytest.raises(Hlr3LoadError, match='load failed'):
+        load_hlr3()
+
+    assert os.listdir(settings.hlr3_batch_directory) == []
+    assert _wait_closed(hlr3_server)
+
+
+def test_failed_full_load_closes_session(hlr3_server):
+    hlr3_server.failing.add(os.path.join(settings.hlr3_batch_directory, 'hlr3_batch.full'))
+
+    with pytest.raises(Hlr3LoadError, match='load failed'):
+        load_hlr3(full_load=True)
+
+    assert len(hlr3_server.calls) == 1
+    assert os.listdir(settings.hlr3_batch_directory) == []
+    assert _wait_closed(hlr3_server)
@@ -0,0 +1,18 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_help_without_settings_of_a_full_run(tmp_path):
+    # only the log file, none of SMSSW_SERVER, TMP_DIRECTORY, ...: the settings are read on first use
+    environment = {'PATH': os.environ['PATH'], 'PYTHONPATH': ROOT, 'LOG_FILE': str(tmp_path / 'main.log')}
+
+    completed = subprocess.run(
+        [sys.executable, os.path.join(ROOT, 'main.py'), '--help'],
+        cwd=tmp_path, env=environment, capture_output=True, text=True,
+    )
+
+    assert completed.returncode == 0, completed.stderr
+    assert '--full-load' in completed.stdout
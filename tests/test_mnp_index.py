@@ -0,0 +1,84 @@
+import os
+import subprocess
+import sqlite3
+import sys
+
+import pytest
+
+from mnp_index import IndexResult, MnpIndex, NumberRecord
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _run_cli(tmp_path, *args: str, **environment: str) -> subprocess.CompletedProcess:
+    # only the variables the tool needs, none of a full run (SMSSW_SERVER, TMP_DIRECTORY, ...)
+    environment = {
+        'PATH': os.environ['PATH'],
+        'PYTHONPATH': ROOT,
+        'LOG_FILE': str(tmp_path / 'mnp_index.log'),
+        **environment,
+    }
+    return subprocess.run(
+        [sys.executable, '-m', 'mnp_index', *args],
+        cwd=tmp_path, env=environment, capture_output=True, text=True,
+    )
+
+
+def test_lookup_without_settings_of_a_full_run(tmp_path):
+    hlr3_file = tmp_path / 'kazakhstan.csv'
+    hlr3_file.write_text('77011234567;40101;1700000000;;\n77017654321;40102;1700000000;owner;\n')
+    index_file = tmp_path / 'mnp_index.sqlite'
+    with MnpIndex(str(index_file)) as index:
+        index.update_country('kazakhstan', str(hlr3_file), 1700000000)
+
+    by_argument = _run_cli(tmp_path, '--index', str(index_file), 'lookup', '77011234567', '70000000000')
+    by_environment = _run_cli(tmp_path, 'lookup', '77017654321', MNP_INDEX_FILE=str(index_file))
+
+    assert by_argument.returncode == 0, by_argument.stderr
+    assert by_argument.stdout == '77011234567;40101;1700000000;;kazakhstan\n70000000000;;;;\n'
+    assert by_environment.returncode == 0, by_environment.stderr
+    assert by_environment.stdout == '77017654321;40102;1700000000;owner;kazakhstan\n'
+
+
+def test_lookup_without_index_file(tmp_path):
+    completed = _run_cli(tmp_path, 'lookup', '77011234567')
+
+    assert completed.returncode == 2
+    assert 'no index file' in completed.stderr
+
+
+def test_lookup_does_not_create_a_missing_index(tmp_path):
+    index_file = tmp_path / 'mnp_index.sqlite'
+
+    completed = _run_cli(tmp_path, '--index', str(index_file), 'lookup', '77011234567')
+
+    assert completed.returncode == 2
+    assert 'does not exist' in completed.stderr
+    with pytest.raises(sqlite3.OperationalError):
+        MnpIndex(str(index_file), read_only=True)
+
+    assert not index_file.exists()
+
+
+def test_changed_then_removed_number_goes_to_history(tmp_path):
+    hlr3_file = tmp_path / 'kazakhstan.csv'
+    index_file = str(tmp_path / 'mnp_index.sqlite')
+    with MnpIndex(index_file) as index:
+        hlr3_file.write_text('77011234567;40101;1700000000;;\n77017654321;40102;1700000000;;\n')
+        index.update_country('kazakhstan', str(hlr3_file), 1700000000)
+        # ported again: a new mccmnc, then missing from the next snapshot
+        hlr3_file.write_text('77011234567;40107;1700000500;;\n77017654321;40102;1700000000;;\n')
+        changed = index.update_country('kazakhstan', str(hlr3_file), 1700001000)
+        hlr3_file.write_text('77017654321;40102;1700000000;;\n')
+        removed = index.update_country('kazakhstan', str(hlr3_file), 1700002000)
+
+    with MnpIndex(index_file, read_only=True) as index:
+        assert (changed, removed) == (IndexResult(changed=1), IndexResult(removed=1))
+        assert index.lookup('77011234567') is None
+        assert index.history('77011234567') == [
+            NumberRecord('77011234567', '40101', 1700000000, None, 'kazakhstan', 1700001000),
+            NumberRecord('77011234567', '40107', 1700000500, None, 'kazakhstan', 1700002000),
+        ]
+        assert index.history('77017654321') == [
+            NumberRecord('77017654321', '40102', 1700000000, None, 'kazakhstan'),
+        ]
@@ -0,0 +1,35 @@
+import asyncio
+
+import pipeline
+from error.errors import FileNotChangedError
+from metrics import STATUS_NOT_CHANGED, CountryMetrics, RunMetrics
+from parsers.parser import AvailableCountry
+from pipeline import Pipeline
+
+
+class _UnchangedSource:
+
+    def get_file(self):
+        raise FileNotChangedError
+
+
+class _FailingLatviaMetrics(RunMetrics):
+
+    def country(self, name: str) -> CountryMetrics:
+        if name == AvailableCountry.Latvia.name:
+            raise RuntimeError('metrics of Latvia are broken')
+
+        return super().country(name)
+
+
+def test_failing_country_metrics_do_not_stop_the_others(monkeypatch):
+    monkeypatch.setattr(pipeline, 'get_file_handler', lambda country: _UnchangedSource())
+    run_metrics = _FailingLatviaMetrics()
+
+    # one pending file: a semaphore slot kept by the failed country would block the others
+    asyncio.run(Pipeline(1, 1, run_metrics).run(list(AvailableCountry)))
+
+    assert {name: metrics.status for name, metrics in run_metrics.countries.items()} == {
+        AvailableCountry.Kazakhstan.name: STATUS_NOT_CHANGED,
+        AvailableCountry.Belarus.name: STATUS_NOT_CHANGED,
+    }
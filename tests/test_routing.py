@@ -0,0 +1,97 @@
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+from array import array
+
+import pytest
+
+import routing
+from routing import LookupServer, Route, RoutingTable, build_snapshot
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def snapshot_file(tmp_path):
+    hlr_file = tmp_path / 'full_hlr_3.csv'
+    # a repeated number keeps the record with the highest active_from, of equal ones the later line
+    hlr_file.write_text(
+        '77011234567;40101;1700000000;;\n'
+        '37120000001;24701;1700000000;;\n'
+        '77011234567;40102;1700000500;;\n'
+        '77011234567;40107;1700000100;;\n'
+        '37120000001;24702;1700000000;;\n',
+    )
+    refbook_file = tmp_path / 'refbook_for_hlr_2.csv'
+    refbook_file.write_text('DIAL_CODE;MCC_MNC\n7701;40101\n77;40177\n371;24705\n')
+    snapshot_file = tmp_path / 'routing.snapshot'
+    build_snapshot(str(hlr_file), str(refbook_file), str(snapshot_file))
+    return snapshot_file
+
+
+def test_resolve_from_snapshot(snapshot_file):
+    table = RoutingTable.load(str(snapshot_file))
+
+    assert len(table) == 2
+    assert table.resolve_many(['77011234567', '37120000001', '77019999999', '77700000000', '49170', 'x']) == [
+        Route('40102'), Route('24702'), Route('40101', '7701'), Route('40177', '77'), None, None,
+    ]
+    # digits of other scripts are not numbers
+    assert table.resolve_many(['7701²', '٧٧٠١١٢٣٤٥٦٧']) == [None, None]
+
+
+def test_latest_records_with_and_without_numpy():
+    pytest.importorskip('numpy')
+    generator = random.Random(1)
+    keys = array('Q', (generator.randrange(1000) for _ in range(5000)))
+    values = array('I', (generator.randrange(20) for _ in range(5000)))
+    active_from = array('q', (generator.randrange(3) for _ in range(5000)))
+
+    sorted_keys, sorted_values = routing._latest_records(keys, values, active_from)
+
+    assert (sorted_keys, sorted_values) == routing._latest_records_without_numpy(keys, values, active_from)
+    assert list(sorted_keys) == sorted(set(keys))
+
+
+def test_lookup_server_replaces_only_a_socket(snapshot_file, tmp_path):
+    table = RoutingTable.load(str(snapshot_file))
+    regular_file = tmp_path / 'routing.sock'
+    regular_file.write_text('not a socket')
+
+    with pytest.raises(OSError):
+        LookupServer(str(regular_file), table)
+
+    assert regular_file.read_text() == 'not a socket'
+
+    socket_path = str(tmp_path / 'lookup.sock')
+    LookupServer(socket_path, table).server_close()
+    with LookupServer(socket_path, table) as server:
+        threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+        with socket.socket(socket.AF_UNIX) as client:
+            client.connect(socket_path)
+            client.sendall(b'77011234567\n7701\xff\n37120000001\n')
+            replies = client.makefile('rb')
+            assert replies.readline() == b'77011234567;40102;\n'
+            assert replies.readline() == '7701\ufffd;;\n'.encode()
+            assert replies.readline() == b'37120000001;24702;\n'
+
+        server.shutdown()
+
+
+def test_resolve_without_settings_of_a_full_run(snapshot_file, tmp_path):
+    environment = {
+        'PATH': os.environ['PATH'],
+        'PYTHONPATH': ROOT,
+        'LOG_FILE': str(tmp_path / 'routing.log'),
+        'ROUTING_SNAPSHOT_FILE': str(snapshot_file),
+    }
+    completed = subprocess.run(
+        [sys.executable, '-m', 'routing', 'resolve', '37120000001', '77700000000'],
+        cwd=tmp_path, env=environment, capture_output=True, text=True,
+    )
+
+    assert completed.returncode == 0, completed.stderr
+    assert completed.stdout == '37120000001;24702;\n77700000000;40177;77\n'
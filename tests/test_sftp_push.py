@@ -0,0 +1,173 @@
+import os
+import socket
+import subprocess
+import threading
+
+import paramiko
+import pytest
+
+from sftp_push import SftpPusher
+
+
+class _StandInServer(paramiko.ServerInterface):
+    """
+    Accepts any key and runs exec requests (sha256sum, python3, cp) with the local shell
+    """
+
+    def __init__(self, commands: list):
+        self.commands = commands
+
+    def get_allowed_auths(self, username: str) -> str:
+        return 'publickey'
+
+    def check_auth_publickey(self, username: str, key: paramiko.PKey) -> int:
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind: str, chanid: int) -> int:
+        return paramiko.OPEN_SUCCEEDED
+
+    def check_channel_exec_request(self, channel: paramiko.Channel, command: bytes) -> bool:
+        self.commands.append(command.decode())
+
+        def execute():
+            process = subprocess.run(command.decode(), shell=True, capture_output=True)
+            channel.sendall(process.stdout)
+            channel.sendall_stderr(process.stderr)
+            channel.send_exit_status(process.returncode)
+            channel.close()
+
+        threading.Thread(target=execute, daemon=True).start()
+        return True
+
+
+class _StandInHandle(paramiko.SFTPHandle):
+
+    def stat(self) -> paramiko.SFTPAttributes:
+        return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+
+    def chattr(self, attr: paramiko.SFTPAttributes) -> int:
+        if attr.st_size is not None:
+            self.readfile.truncate(attr.st_size)
+
+        return paramiko.SFTP_OK
+
+
+class _StandInSftp(paramiko.SFTPServerInterface):
+    # every open and rename is recorded into operations, shared through the server
+    operations: list = []
+
+    def open(self, path: str, flags: int, attr: paramiko.SFTPAttributes) -> paramiko.SFTPHandle:
+        self.operations.append(('open', path))
+        mode = 'r+b' if flags & os.O_RDWR else 'wb' if flags & os.O_WRONLY else 'rb'
+        handle = _StandInHandle(flags)
+        handle.readfile = handle.writefile = os.fdopen(os.open(path, flags, 0o644), mode)
+        return handle
+
+    def stat(self, path: str) -> paramiko.SFTPAttributes:
+        return paramiko.SFTPAttributes.from_stat(os.stat(path))
+
+    lstat = stat
+
+    def posix_rename(self, old_path: str, new_path: str) -> int:
+        self.operations.append(('posix_rename', old_path, new_path))
+        os.replace(old_path, new_path)
+        return paramiko.SFTP_OK
+
+
+@pytest.fixture
+def ssh_server(tmp_path, monkeypatch):
+    """
+    Paramiko SSH server with SFTP and exec on a free local port, the client authenticates with a new key
+    :return: port and the lists of executed commands and SFTP operations
+    """
+    home = tmp_path / 'home'
+    (home / '.ssh').mkdir(parents=True)
+    paramiko.ECDSAKey.generate().write_private_key_file(str(home / '.ssh' / 'id_ecdsa'))
+    monkeypatch.setenv('HOME', str(home))
+    monkeypatch.delenv('SSH_AUTH_SOCK', raising=False)
+
+    host_key = paramiko.ECDSAKey.generate()
+    commands = []
+    operations = []
+    monkeypatch.setattr(_StandInSftp, 'operations', operations)
+    listener = socket.create_server(('127.0.0.1', 0))
+    transports = []
+
+    def accept():
+        while True:
+            try:
+                connection, _ = listener.accept()
+            except OSError:
+                return
+
+            transport = paramiko.Transport(connection)
+            transport.add_server_key(host_key)
+            transport.set_subsystem_handler('sftp', paramiko.SFTPServer, _StandInSftp)
+            transport.start_server(server=_StandInServer(commands))
+            transports.append(transport)
+
+    threading.Thread(target=accept, daemon=True).start()
+    yield listener.getsockname()[1], commands, operations
+
+    listener.close()
+    for transport in transports:
+        transport.close()
+
+
+@pytest.fixture
+def files(tmp_path):
+    source_file = tmp_path / 'full.csv'
+    source_file.write_bytes(os.urandom(640 * 1024 + 123))
+    remote_directory = tmp_path / 'remote'
+    remote_directory.mkdir()
+    return source_file, remote_directory / 'full.csv'
+
+
+@pytest.mark.parametrize('compress', [True, False])
+def test_upload_to_temporary_name_and_rename(ssh_server, files, compress):
+    port, _, operations = ssh_server
+    source_file, destination = files
+
+    with SftpPusher('127.0.0.1', port, 'mnp', compress) as pusher:
+        push_result = pusher.push(str(source_file), str(destination))
+
+    assert push_result.bytes_sent == source_file.stat().st_size
+    assert not push_result.skipped
+    assert destination.read_bytes() == source_file.read_bytes()
+    assert operations == [
+        ('open', f'{destination}.tmp'),
+        ('posix_rename', f'{destination}.tmp', str(destination)),
+    ]
+
+
+def test_skip_when_checksums_match(ssh_server, files):
+    port, commands, operations = ssh_server
+    source_file, destination = files
+    destination.write_bytes(source_file.read_bytes())
+
+    with SftpPusher('127.0.0.1', port, 'mnp') as pusher:
+        push_result = pusher.push(str(source_file), str(destination))
+
+    assert push_result.skipped
+    assert push_result.bytes_sent == 0
+    assert operations == []
+    assert commands == [f'sha256sum -- {destination}']
+
+
+def test_changed_file_is_sent_whole(ssh_server, files):
+    port, _, operations = ssh_server
+    source_file, destination = files
+    # one inserted line shifts every later byte of the remote copy
+    destination.write_bytes(source_file.read_bytes())
+    content = b'77011234567;40101;1700000000;;\n' + source_file.read_bytes()
+    source_file.write_bytes(content)
+
+    with SftpPusher('127.0.0.1', port, 'mnp') as pusher:
+        push_result = pusher.push(str(source_file), str(destination))
+
+    assert push_result.bytes_sent == len(content)
+    assert destination.read_bytes() == content
+    assert operations == [
+        ('open', f'{destination}.tmp'),
+        ('posix_rename', f'{destination}.tmp', str(destination)),
+    ]
@@ -1,106 +1,686 @@
 import csv
+import errno
+import glob
 import zipfile
 import ftplib
 import os
-import paramiko
+import time
 
-from scp import SCPClient
-from datetime import datetime
+from concurrent.futures import Executor, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from functools import partial
 from pathlib import Path
+from typing import TYPE_CHECKING, BinaryIO, Callable, Dict, Iterator, List, Optional, Protocol, Tuple, Union
 
-from config import settings
+from archiver import ArchiveStore, Codec, compress_file, get_codec
+from config import BelarusMnpSettings, KazakhstanMnpSettings, LatviaMnpSettings, settings
+from delta import compute_delta, snapshot_file
+from error.errors import GetFileError
 from logger_config import configure_logger
-from parsers.parser import AvailableCountry, ParseResult
+from mnp_index import MnpIndex
+from parsers.chunks import split_file
+from parsers.parser import (
+    FTP_CSV_FORMAT,
+    HLR3_CSV_FORMAT,
+    AvailableCountry,
+    MnpRecord,
+    ParseResult,
+    get_parser,
+)
+from profiler import profile_stage
+
+if TYPE_CHECKING:
+    from parsers.columnar import ColumnBlock
 
 logger = configure_logger(__name__)
 
+COPY_BUFFER_SIZE = 1024 * 1024
+_KERNEL_COPY_UNSUPPORTED = (errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF)
+
+
+class FtpSettings(Protocol):
+    ftp_server: str
+    ftp_port: int
+    ftp_user: str
+    ftp_password: str
+
 
 def get_latest_file_from_ftp(ftp: ftplib.FTP) -> str:
+    return get_latest_entry_from_ftp(ftp)[0]
+
+
+def get_latest_entry_from_ftp(ftp: ftplib.FTP) -> Tuple[str, Dict[str, str]]:
+    """
+    :return: name and MLSD facts of the newest file in the current FTP directory
+    """
     logger.debug('Fetching latest file from FTP')
     entries = list(filter(lambda entrie: entrie[1]['type'] == 'file', list(ftp.mlsd())))
     entries.sort(key=lambda entry: entry[1]['modify'], reverse=True)
-    file = entries[0][0]
-    logger.debug(f'Latest file: {file}')
-    return file
+    file, facts = entries[0]
+    logger.debug(f'Latest file: {file}, size: {facts.get("size")}, modify: {facts.get("modify")}')
+    return file, facts
+
+
+def connect_ftp(ftp_settings: FtpSettings, timeout: int = 20) -> ftplib.FTP:
+    """
+    Open a logged in FTP session to a country source
+    """
+    ftp = ftplib.FTP()
+    try:
+        ftp.connect(ftp_settings.ftp_server, ftp_settings.ftp_port, timeout=timeout)
+        ftp.login(ftp_settings.ftp_user, ftp_settings.ftp_password)
+    except (TimeoutError, OSError, ftplib.Error) as err:
+        logger.error(f'could not connect to {ftp_settings.ftp_server}:{ftp_settings.ftp_port}')
+        raise GetFileError() from err
+
+    return ftp
+
+
+def close_ftp(ftp: ftplib.FTP) -> None:
+    try:
+        ftp.quit()
+    except (OSError, EOFError, ftplib.Error):
+        ftp.close()
 
 
 def download_file(
         file_name: str,
         ftp: ftplib.FTP,
+        size: Optional[int] = None,
+        connect: Optional[Callable[[], ftplib.FTP]] = None,
+        modified: Optional[str] = None,
 ) -> Path:
-    # download file from FTP and return path to file
+    """
+    Download a file from FTP into TMP_DIRECTORY.
+    Data goes to a .part file first, a partial file left by an interrupted run is resumed with REST
+    unless it is bigger than the remote file or older than its modification time, then it is downloaded again.
+    With connect, a dropped session is reopened and resumed up to FTP_RETRIES times, and a file of known size
+    bigger than FTP_SEGMENT_MIN_SIZE is fetched in FTP_SEGMENTS parallel ranged sessions
+    :param ftp: logged in session, used for single stream downloads
+    :param size: expected size from the MLSD facts, the downloaded file is checked against it
+    :param connect: opens a new logged in session
+    :param modified: modification time from the MLSD facts (YYYYMMDDHHMMSS, UTC), asked with MDTM when missing
+    :return: path to the downloaded file
+    """
     logger.debug(f'Downloading {file_name}')
     download_path = Path(settings.tmp_directory).joinpath(file_name)
-    with open(download_path, 'wb') as f:
-        ftp.retrbinary(f'RETR {file_name}', f.write)
+    started = time.monotonic()
+    _discard_stale_parts(file_name, download_path, ftp, size, modified)
+
+    if connect and size and settings.ftp_segments > 1 and size >= settings.ftp_segment_min_size:
+        _download_segmented(file_name, download_path, size, connect)
+    else:
+        part_file = Path(f'{download_path}.part')
+        _download_stream(file_name, part_file, ftp, connect)
+        os.replace(part_file, download_path)
 
-    logger.debug(f'Finished downloading {file_name}')
+    downloaded = os.path.getsize(download_path)
+    if size is not None and downloaded != size:
+        logger.error(f'Downloaded {downloaded} bytes of {file_name}, expected {size}')
+        os.remove(download_path)
+        raise GetFileError
+
+    elapsed = max(time.monotonic() - started, 1e-6)
+    logger.info(f'Finished downloading {file_name}: {downloaded} bytes in {elapsed:.1f}s, '
+                f'{downloaded / elapsed / 1024 / 1024:.2f} MiB/s')
     return download_path
 
 
+def _discard_stale_parts(
+        file_name: str,
+        download_path: Path,
+        ftp: Optional[ftplib.FTP],
+        size: Optional[int],
+        modified: Optional[str],
+) -> None:
+    # a part left by an earlier run does not belong to a replaced remote file, a REST past its end fails every run
+    part_files = list(download_path.parent.glob(f'{glob.escape(download_path.name)}.part*'))
+    if not part_files:
+        return
+
+    if ftp is not None:
+        size, modified = _get_remote_facts(file_name, ftp, size, modified)
+
+    modified_at = _parse_ftp_time(modified) if modified else None
+    for part_file in part_files:
+        part_stat = part_file.stat()
+        if (size is not None and part_stat.st_size > size) or (modified_at and part_stat.st_mtime < modified_at):
+            logger.info(f'{file_name} changed since {part_file} was written, downloading it again')
+            part_file.unlink()
+
+
+def _get_remote_facts(
+        file_name: str,
+        ftp: ftplib.FTP,
+        size: Optional[int],
+        modified: Optional[str],
+) -> Tuple[Optional[int], Optional[str]]:
+    # SIZE and MDTM are extensions, a server without them leaves the facts unknown
+    try:
+        if size is None:
+            ftp.voidcmd('TYPE I')
+            size = ftp.size(file_name)
+
+        if modified is None:
+            modified = ftp.sendcmd(f'MDTM {file_name}').split()[-1]
+    except ftplib.Error as err:
+        logger.debug(f'no size or modification time of {file_name}: {err}')
+
+    return size, modified
+
+
+def _parse_ftp_time(value: str) -> Optional[float]:
+    # YYYYMMDDHHMMSS[.sss] in UTC, as in MLSD facts and MDTM replies
+    try:
+        return datetime.strptime(value[:14], '%Y%m%d%H%M%S').replace(tzinfo=timezone.utc).timestamp()
+    except ValueError:
+        return None
+
+
+def _download_stream(
+        file_name: str,
+        part_file: Path,
+        ftp: ftplib.FTP,
+        connect: Optional[Callable[[], ftplib.FTP]],
+) -> None:
+    # sessions opened here to resume are closed here, the given one belongs to the caller
+    session = ftp
+    try:
+        for attempt in range(settings.ftp_retries + 1):
+            offset = _get_file_size(part_file)
+            if offset:
+                logger.info(f'Resuming {file_name} from {offset} bytes')
+
+            try:
+                with open(part_file, 'ab') as f:
+                    session.retrbinary(f'RETR {file_name}', f.write, rest=offset or None)
+
+                return
+            except (OSError, EOFError, ftplib.Error) as err:
+                if connect is None or attempt == settings.ftp_retries:
+                    raise
+
+                logger.warning(f'Download of {file_name} interrupted ({err}), reconnecting')
+                if session is not ftp:
+                    close_ftp(session)
+
+                session = connect()
+    finally:
+        if session is not ftp:
+            close_ftp(session)
+
+
+def _download_segmented(
+        file_name: str,
+        download_path: Path,
+        size: int,
+        connect: Callable[[], ftplib.FTP],
+) -> None:
+    segments = settings.ftp_segments
+    segment_size = -(-size // segments)
+    ranges = [(start, min(start + segment_size, size)) for start in range(0, size, segment_size)]
+    part_files = [f'{download_path}.part{index}' for index in range(len(ranges))]
+    logger.info(f'Downloading {file_name} in {len(ranges)} segments')
+
+    with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+        futures = [
+            executor.submit(_download_segment, file_name, part_file, start, end, connect)
+            for part_file, (start, end) in zip(part_files, ranges)
+        ]
+        for future in futures:
+            future.result()
+
+    concatenate_files(part_files, str(download_path))
+    _remove_silently(*part_files)
+
+
+def _download_segment(
+        file_name: str,
+        part_file: str,
+        start: int,
+        end: int,
+        connect: Callable[[], ftplib.FTP],
+) -> None:
+    for attempt in range(settings.ftp_retries + 1):
+        offset = start + _get_file_size(part_file)
+        if offset >= end:
+            return
+
+        ftp = connect()
+        try:
+            ftp.voidcmd('TYPE I')
+            with ftp.transfercmd(f'RETR {file_name}', rest=offset) as conn, open(part_file, 'ab') as f:
+                remaining = end - offset
+                while remaining > 0:
+                    data = conn.recv(min(COPY_BUFFER_SIZE, remaining))
+                    if not data:
+                        break
+
+                    f.write(data)
+                    remaining -= len(data)
+
+            if remaining == 0:
+                return
+
+            logger.warning(f'Segment {start}-{end} of {file_name} ended early, {remaining} bytes left')
+        except (OSError, EOFError, ftplib.Error) as err:
+            if attempt == settings.ftp_retries:
+                raise
+
+            logger.warning(f'Segment {start}-{end} of {file_name} interrupted ({err}), reconnecting')
+        finally:
+            # the transfer is cut before the end of the file, the session is not reused
+            ftp.close()
+
+    raise GetFileError
+
+
+def _get_file_size(file: Union[str, Path]) -> int:
+    try:
+        return os.path.getsize(file)
+    except FileNotFoundError:
+        return 0
+
+
 def archive_file(
         source_file: str,
         file_prefix: str,
-) -> None:
+) -> str:
+    """
+    Archive source_file into ARCHIVE_DIRECTORY as {file_prefix}-{YYYYMMDD} with the extension of ARCHIVE_CODEC:
+    a zip file without compression for stored, a compressed file (see archiver) for the other codecs.
+    A compressed file does not keep the name of its source, so its name is followed by the source file name
+    ({file_prefix}-{YYYYMMDD}-{source name}.gz), parsers pick the format by the extension of the name.
+    With ARCHIVE_DEDUP the archive goes to the content addressed store instead and is only written for new content
+    :return: path of the archive
+    """
     logger.debug(f'Starting archiving {source_file}')
-    archive_name = f'{file_prefix}-{datetime.now().strftime("%Y%m%d")}.zip'
-    archive_file = os.path.join(settings.archive_dir, archive_name)
-    logger.debug(f'Archive file: {archive_file}')
-    with zipfile.ZipFile(archive_file, 'w') as zip_file:
-        zip_file.write(source_file, arcname=os.path.basename(source_file))
+    if settings.archive_codec == 'stored':
+        extension, write_archive = '.zip', _write_zip_archive
+    else:
+        codec = get_codec(settings.archive_codec)
+        extension, write_archive = codec.extension, partial(_write_compressed_archive, codec=codec)
 
-    logger.debug('Finished archiving')
+    if settings.archive_dedup:
+        archive_file = ArchiveStore(settings.archive_dir).add(source_file, file_prefix, extension, write_archive)
+    else:
+        archive_name = f'{file_prefix}-{datetime.now().strftime("%Y%m%d")}'
+        if extension != '.zip':
+            archive_name = f'{archive_name}-{os.path.basename(source_file)}'
+
+        archive_name = f'{archive_name}{extension}'
+        archive_file = os.path.join(settings.archive_dir, archive_name)
+        write_archive(source_file, archive_file)
+
+    logger.debug(f'Finished archiving: {archive_file}')
+    return archive_file
+
+
+def _write_zip_archive(source_file: str, archive_file: str) -> None:
+    # written aside and renamed, a partial archive must not pass for an archived content
+    tmp_archive_file = f'{archive_file}.tmp'
+    try:
+        with zipfile.ZipFile(tmp_archive_file, 'w') as zip_file:
+            zip_file.write(source_file, arcname=os.path.basename(source_file))
+    except BaseException:
+        _remove_silently(tmp_archive_file)
+        raise
+
+    os.replace(tmp_archive_file, archive_file)
+
+
+def _write_compressed_archive(source_file: str, archive_file: str, codec: Codec) -> None:
+    compress_file(
+        source_file,
+        archive_file,
+        codec,
+        settings.archive_level,
+        settings.archive_block_size,
+        settings.archive_threads,
+    )
 
 
 def get_country_prefix(country: AvailableCountry) -> str:
     match country:
         case country.Belarus:
-            return settings.belarus_settings.file_prefix
+            return BelarusMnpSettings.file_prefix
         case country.Kazakhstan:
-            return settings.kazakhstan_settings.file_prefix
+            return KazakhstanMnpSettings.file_prefix
         case country.Latvia:
-            return settings.latvia_settings.file_prefix
+            return LatviaMnpSettings.file_prefix
 
 
 def push_file_to_server(server: str, port: int, source_file: str, destination_path: str) -> None:
-    logger.info(f'Pushing {source_file} to {server}:{destination_path}')
+    # paramiko and scp are slow to import, only runs that push need them
+    from scp import SCPClient
+    from sftp_push import connect_ssh
 
-    ssh = paramiko.SSHClient()
-    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    ssh.connect(
-        server,
-        port,
-        username=settings.smssw_user,
-        disabled_algorithms={
-            'pubkeys': ['rsa-sha2-512', 'rsa-sha2-256'],
-        },
-    )
+    logger.info(f'Pushing {source_file} to {server}:{destination_path}')
 
+    ssh = connect_ssh(server, port, settings.smssw_user)
     scp = SCPClient(ssh.get_transport())
     scp.put(source_file, destination_path)
     scp.close()
     ssh.close()
 
 
-def save_parse_result(parsed_result: ParseResult, country: AvailableCountry) -> None:
+def push_files_to_server(server: str, port: int, files: List[Tuple[str, str]]) -> int:
+    """
+    Push (source file, destination path) pairs with PUSH_MODE:
+    scp copies every file in its own session, sftp goes through one session (see sftp_push)
+    :return: number of bytes sent
+    """
+    if settings.push_mode == 'scp':
+        for source_file, destination_path in files:
+            push_file_to_server(server, port, source_file, destination_path)
+
+        return sum(os.path.getsize(source_file) for source_file, _ in files)
+
+    from sftp_push import SftpPusher
+
+    bytes_sent = 0
+    with SftpPusher(server, port, settings.smssw_user, settings.push_compress) as pusher:
+        for source_file, destination_path in files:
+            bytes_sent += pusher.push(source_file, destination_path).bytes_sent
+
+    return bytes_sent
+
+
+def save_parse_result(records: Iterator[MnpRecord], country: AvailableCountry) -> ParseResult:
+    """
+    Consume parsed records and write the FTP and HLR3 files in a single pass.
+    Files are written next to the destination and only replace it when both of them got records,
+    so an empty parse never overwrites the previous result
+    :return: number of records written to each file
+    """
     logger.info('start save parse result')
+    ftp_file, hlr3_file = _get_output_files(country)
+    ftp_tmp_file = f'{ftp_file}.tmp'
+    hlr3_tmp_file = f'{hlr3_file}.tmp'
 
-    hlr3_fields = ('dnis', 'mccmnc', 'active_from', 'ownerID', 'providerResponseCode')
-    ftp_fields = ('dnis', 'mccmnc')
-    file_prefix = get_country_prefix(country)
+    try:
+        parse_result = _write_records(records, ftp_tmp_file, hlr3_tmp_file)
+    except BaseException:
+        _remove_silently(ftp_tmp_file, hlr3_tmp_file)
+        raise
 
-    ftp_file = os.path.join(settings.ftp_directory, file_prefix, f'{file_prefix}.csv')
-    logger.info(f'saving ftp file to: {ftp_file}')
+    return _commit_parse_result(parse_result, country, ftp_tmp_file, hlr3_tmp_file)
+
+
+def save_parse_result_columnar(blocks: Iterator['ColumnBlock'], country: AvailableCountry) -> ParseResult:
+    """
+    save_parse_result for the columnar backend: blocks of rows come already formatted
+    :return: number of records written to each file
+    """
+    logger.info('start save columnar parse result')
+    ftp_file, hlr3_file = _get_output_files(country)
+    ftp_tmp_file = f'{ftp_file}.tmp'
+    hlr3_tmp_file = f'{hlr3_file}.tmp'
+
+    parse_result = ParseResult()
+    try:
+        # newline='' so line endings are written as formatted
+        with open(ftp_tmp_file, 'w', newline='') as ftp_f, open(hlr3_tmp_file, 'w', newline='') as hlr_f:
+            for block in blocks:
+                ftp_f.write(block.ftp_text)
+                hlr_f.write(block.hlr3_text)
+                parse_result.hlr_records += block.hlr_records
+                parse_result.hlr3_records += block.hlr3_records
+    except BaseException:
+        _remove_silently(ftp_tmp_file, hlr3_tmp_file)
+        raise
+
+    return _commit_parse_result(parse_result, country, ftp_tmp_file, hlr3_tmp_file)
+
+
+def save_parse_result_chunked(
+        country: AvailableCountry,
+        in_file: str,
+        executor: Executor,
+        chunk_size: int,
+        run_timestamp: Optional[int] = None,
+) -> ParseResult:
+    """
+    Parse a line based mnp file in chunks of about chunk_size bytes on the executor
+    and merge the chunk outputs in order, the result is identical to save_parse_result
+    :return: number of records written to each file
+    """
+    chunks = split_file(in_file, chunk_size)
+    logger.info(f'start chunked save parse result: {len(chunks)} chunks of {in_file}')
+    ftp_file, hlr3_file = _get_output_files(country)
+    ftp_tmp_file = f'{ftp_file}.tmp'
+    hlr3_tmp_file = f'{hlr3_file}.tmp'
+    ftp_parts = [f'{ftp_file}.part{index}' for index in range(len(chunks))]
+    hlr3_parts = [f'{hlr3_file}.part{index}' for index in range(len(chunks))]
+
+    parse_result = ParseResult()
+    futures = []
+    try:
+        futures = [
+            executor.submit(save_chunk, country, in_file, start, end, ftp_part, hlr3_part, run_timestamp)
+            for (start, end), ftp_part, hlr3_part in zip(chunks, ftp_parts, hlr3_parts)
+        ]
+        for future in futures:
+            chunk_result = future.result()
+            parse_result.hlr_records += chunk_result.hlr_records
+            parse_result.hlr3_records += chunk_result.hlr3_records
+            parse_result.rows_read += chunk_result.rows_read
+            for error_type, count in chunk_result.row_errors.items():
+                parse_result.row_errors[error_type] = parse_result.row_errors.get(error_type, 0) + count
+
+        concatenate_files(ftp_parts, ftp_tmp_file)
+        concatenate_files(hlr3_parts, hlr3_tmp_file)
+    except BaseException:
+        for future in futures:
+            future.cancel()
+
+        _remove_silently(ftp_tmp_file, hlr3_tmp_file)
+        raise
+    finally:
+        wait(futures)
+        _remove_silently(*ftp_parts, *hlr3_parts)
+
+    return _commit_parse_result(parse_result, country, ftp_tmp_file, hlr3_tmp_file)
+
+
+def save_chunk(
+        country: AvailableCountry,
+        in_file: str,
+        start: int,
+        end: int,
+        ftp_part: str,
+        hlr3_part: str,
+        run_timestamp: Optional[int] = None,
+) -> ParseResult:
+    # runs in a worker process, writes output of the [start, end) byte range of in_file
+    parser = get_parser(country, run_timestamp)
+    with profile_stage(f'{country.name}.parse.{start}'):
+        parse_result = _write_records(parser.parse_chunk(in_file, start, end), ftp_part, hlr3_part)
+
+    parse_result.rows_read = parser.rows_read
+    parse_result.row_errors = parser.row_errors.counts
+    return parse_result
+
+
+@dataclass
+class JoinResult:
+    files: int = 0
+    bytes: int = 0
+    lines: int = 0
+
+
+def concatenate_files(sources: List[str], destination: str, count_lines: bool = False) -> JoinResult:
+    """
+    Concatenate files into destination without loading them into memory, destination is replaced atomically.
+    The copy is done by the kernel when possible, with count_lines it goes through a buffer that is counted,
+    so no file is read twice
+    :return: number of files, bytes and (if count_lines) lines joined
+    """
+    join_result = JoinResult()
+    tmp_destination = f'{destination}.tmp'
+    try:
+        with open(tmp_destination, 'wb', buffering=0) as out_f:
+            for source in sources:
+                with open(source, 'rb', buffering=0) as in_f:
+                    size = os.fstat(in_f.fileno()).st_size
+                    if count_lines:
+                        copied, lines = copy_counting_lines(in_f, out_f)
+                        join_result.lines += lines
+                    else:
+                        copied = copy_file_contents(in_f, out_f)
+
+                if copied != size:
+                    raise OSError(errno.EIO, f'copied {copied} of {size} bytes', source)
+
+                join_result.bytes += copied
+                join_result.files += 1
+    except BaseException:
+        _remove_silently(tmp_destination)
+        raise
 
-    with open(ftp_file, 'w') as ftp_f:
-        csv_writer = csv.DictWriter(ftp_f, fieldnames=ftp_fields, delimiter=';')
-        csv_writer.writerows(parsed_result.hlr_records)
+    os.replace(tmp_destination, destination)
+    return join_result
 
+
+def copy_file_contents(in_f: BinaryIO, out_f: BinaryIO) -> int:
+    """
+    Append the whole in_f to out_f, both must be unbuffered.
+    Tries copy_file_range, then sendfile, then falls back to a large buffer copy,
+    which also finishes a kernel copy that stopped short of the file size
+    :return: number of bytes copied
+    """
+    size = os.fstat(in_f.fileno()).st_size
+    copied = 0
+    for kernel_copy in (_copy_file_range, _sendfile):
+        copied = _kernel_copy(kernel_copy, in_f, out_f, copied, size)
+        if copied == size:
+            return copied
+
+        if copied:
+            break
+
+    in_f.seek(copied)
+    while True:
+        chunk = in_f.read(COPY_BUFFER_SIZE)
+        if not chunk:
+            return copied
+
+        _write_all(out_f, chunk)
+        copied += len(chunk)
+
+
+def _kernel_copy(
+        kernel_copy: Callable[[int, int, int], int],
+        in_f: BinaryIO,
+        out_f: BinaryIO,
+        copied: int,
+        size: int,
+) -> int:
+    """
+    Copy in_f from copied up to size with kernel_copy
+    :return: bytes copied so far, less than size when the method is not supported or stopped early
+    """
+    try:
+        while copied < size:
+            sent = kernel_copy(in_f.fileno(), out_f.fileno(), size - copied)
+            if sent == 0:
+                break
+
+            copied += sent
+    except (AttributeError, OSError) as err:
+        # not available on this platform/filesystem
+        if isinstance(err, OSError) and err.errno not in _KERNEL_COPY_UNSUPPORTED:
+            raise
+
+    return copied
+
+
+def copy_counting_lines(in_f: BinaryIO, out_f: BinaryIO) -> Tuple[int, int]:
+    """
+    Append the whole in_f to out_f through a large buffer, both must be unbuffered
+    :return: number of bytes and lines copied
+    """
+    copied = 0
+    lines = 0
+    while chunk := in_f.read(COPY_BUFFER_SIZE):
+        _write_all(out_f, chunk)
+        copied += len(chunk)
+        lines += chunk.count(b'\n')
+
+    return copied, lines
+
+
+def _write_all(out_f: BinaryIO, chunk: bytes) -> None:
+    # an unbuffered write may take only a part of the chunk
+    view = memoryview(chunk)
+    while view:
+        view = view[out_f.write(view):]
+
+
+def _copy_file_range(in_fd: int, out_fd: int, count: int) -> int:
+    return os.copy_file_range(in_fd, out_fd, count)
+
+
+def _sendfile(in_fd: int, out_fd: int, count: int) -> int:
+    return os.sendfile(out_fd, in_fd, None, count)
+
+
+def _get_output_files(country: AvailableCountry) -> Tuple[str, str]:
+    file_prefix = get_country_prefix(country)
+    ftp_file = os.path.join(settings.ftp_directory, file_prefix, f'{file_prefix}.csv')
     hlr3_file = os.path.join(settings.hlr_directory, file_prefix, f'{file_prefix}.csv')
-    logger.info(f'saving hlr3 file to: {hlr3_file}')
+    return ftp_file, hlr3_file
+
+
+def _write_records(records: Iterator[MnpRecord], ftp_file: str, hlr3_file: str) -> ParseResult:
+    parse_result = ParseResult()
+    with open(ftp_file, 'w') as ftp_f, open(hlr3_file, 'w') as hlr_f:
+        # FTP file: dnis;mccmnc, HLR3 file: dnis;mccmnc;active_from;ownerID;providerResponseCode
+        ftp_writer = csv.writer(ftp_f, **FTP_CSV_FORMAT)
+        hlr3_writer = csv.writer(hlr_f, **HLR3_CSV_FORMAT)
+        for record in records:
+            ftp_writer.writerow(record.hlr_row())
+            parse_result.hlr_records += 1
+            if record.active_from is not None:
+                hlr3_writer.writerow(record.hlr3_row())
+                parse_result.hlr3_records += 1
 
-    with open(hlr3_file, 'w') as hlr_f:
-        csv_writer = csv.DictWriter(hlr_f, fieldnames=hlr3_fields, delimiter=';')
-        csv_writer.writerows(parsed_result.hlr3_records)
+    return parse_result
+
+
+def _commit_parse_result(
+        parse_result: ParseResult,
+        country: AvailableCountry,
+        ftp_tmp_file: str,
+        hlr3_tmp_file: str,
+) -> ParseResult:
+    if parse_result.hlr_records == 0 or parse_result.hlr3_records == 0:
+        logger.warning(f'nothing to save for {country.name}, keep previous files')
+        _remove_silently(ftp_tmp_file, hlr3_tmp_file)
+        return parse_result
+
+    ftp_file, hlr3_file = _get_output_files(country)
+    logger.info(f'saving ftp file to: {ftp_file} ({parse_result.hlr_records} records)')
+    os.replace(ftp_tmp_file, ftp_file)
+    logger.info(f'saving hlr3 file to: {hlr3_file} ({parse_result.hlr3_records} records)')
+    os.replace(hlr3_tmp_file, hlr3_file)
+    parse_result.output_bytes = os.path.getsize(ftp_file) + os.path.getsize(hlr3_file)
+
+    if settings.hlr_delta:
+        compute_delta(snapshot_file(hlr3_file), hlr3_file)
+
+    if settings.mnp_index_file:
+        with MnpIndex(settings.mnp_index_file) as index:
+            index.update_country(country.name, hlr3_file)
 
     logger.info('finishing save parse result')
+    return parse_result
+
+
+def _remove_silently(*files: str) -> None:
+    for file in files:
+        try:
+            os.remove(file)
+        except FileNotFoundError:
+            pass